@@ -1,7 +1,10 @@
 # Antigravity Ultra - Agent Engine
-import json
+import orjson
 import re
-from typing import List, Dict, Any, Optional, AsyncGenerator
+import asyncio
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncGenerator, Deque, Tuple
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum
 import sys
@@ -10,9 +13,18 @@ import os
 # Add parent to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import ChatMessage, ModelOrchestrator, orchestrator
+from models import ChatMessage, ModelOrchestrator, get_orchestrator
 from config import config
 from agent.tools import WebSearchTool, FileOpsTool, CodeExecutor
+from agent.tools.code_executor import OutputCallback
+
+
+# Matches ```tool ... ``` blocks emitted by the model
+_TOOL_FENCE = "```tool"
+_TOOL_RE = re.compile(r'```tool\s*\n(.*?)\n```', re.DOTALL)
+
+# Tools that don't touch the filesystem or run code, free to overlap the others
+_CONCURRENT_TOOLS = frozenset({"web_search"})
 
 
 class AgentStatus(Enum):
@@ -63,40 +75,90 @@ Caractéristiques:
 
 Réponds à l'utilisateur de manière complète et utile."""
 
+def _estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)"""
+    return len(text) // 4
+
+
+# Shared system messages, built once instead of on every turn. Their content
+# never changes, so every request starts with the same cacheable prefix.
+_SYSTEM_MSG = ChatMessage(role="system", content=SYSTEM_PROMPT, cache=True)
+_SIMPLE_SYSTEM_MSG = ChatMessage(
+    role="system",
+    content="Tu es Antigravity Ultra, une IA utile et précise. Réponds en français.",
+    cache=True
+)
+
 
 class Agent:
     """Autonomous AI agent with tool calling capabilities"""
     
     def __init__(self):
-        self.orchestrator = orchestrator
         self.web_search = WebSearchTool()
         self.file_ops = FileOpsTool()
         self.code_executor = CodeExecutor()
         self.status = AgentStatus.IDLE
-        self.conversation: List[ChatMessage] = []
+        self.conversation: Deque[ChatMessage] = deque()
+        self._history_tokens = 0
         self.max_iterations = config.max_iterations
+        self.max_history_tokens = config.max_history_tokens
     
-    def _parse_tool_calls(self, text: str) -> List[ToolCall]:
-        """Extract tool calls from response text"""
+    @property
+    def orchestrator(self) -> ModelOrchestrator:
+        """Shared model orchestrator, created on first use"""
+        return get_orchestrator()
+    
+    def _remember(self, role: str, content: str):
+        """Append a message to the history, dropping the oldest past the token budget"""
+        self.conversation.append(ChatMessage(role=role, content=content))
+        self._history_tokens += _estimate_tokens(content)
+        
+        # Always keep the newest message, and never start the history on an assistant turn
+        while len(self.conversation) > 1 and (
+            self._history_tokens > self.max_history_tokens
+            or self.conversation[0].role == "assistant"
+        ):
+            self._history_tokens -= _estimate_tokens(self.conversation.popleft().content)
+    
+    def _parse_tool_block(self, block: str) -> Optional[ToolCall]:
+        """Parse the JSON body of a single tool block"""
+        try:
+            data = orjson.loads(block.strip())
+        except orjson.JSONDecodeError:
+            return None
+        return ToolCall(
+            name=data.get("name", ""),
+            arguments=data.get("arguments", {})
+        )
+    
+    def _scan_tool_calls(self, buffer: str, start: int = 0) -> Tuple[List[ToolCall], int]:
+        """Parse complete tool blocks from start on; returns the calls and where to resume"""
         tool_calls = []
         
-        # Find all tool blocks
-        pattern = r'```tool\s*\n(.*?)\n```'
-        matches = re.findall(pattern, text, re.DOTALL)
-        
-        for match in matches:
-            try:
-                data = json.loads(match.strip())
-                tool_calls.append(ToolCall(
-                    name=data.get("name", ""),
-                    arguments=data.get("arguments", {})
-                ))
-            except json.JSONDecodeError:
-                continue
-        
-        return tool_calls
+        for match in _TOOL_RE.finditer(buffer, start):
+            start = match.end()
+            tool_call = self._parse_tool_block(match.group(1))
+            if tool_call:
+                tool_calls.append(tool_call)
+        
+        # Resume at a block that hasn't closed yet, or just before a fence still arriving
+        opening = buffer.find(_TOOL_FENCE, start)
+        if opening == -1:
+            start = max(start, len(buffer) - len(_TOOL_FENCE) + 1)
+        else:
+            start = opening
+        
+        return tool_calls, start
+    
+    def _parse_tool_calls(self, text: str) -> List[ToolCall]:
+        """Extract tool calls from response text"""
+        return self._scan_tool_calls(text)[0]
     
-    async def _execute_tool(self, tool_call: ToolCall) -> str:
+    async def _execute_tool(
+        self,
+        tool_call: ToolCall,
+        on_output: Optional[OutputCallback] = None
+    ) -> str:
         """Execute a tool call and return result"""
         name = tool_call.name
         args = tool_call.arguments
@@ -108,21 +170,22 @@ class Agent:
                     args.get("num_results", 5)
                 )
             elif name == "read_file":
-                result = self.file_ops.read_file(args.get("path", ""))
+                result = await self.file_ops.read_file_async(args.get("path", ""))
             elif name == "write_file":
-                result = self.file_ops.write_file(
+                result = await self.file_ops.write_file_async(
                     args.get("path", ""),
                     args.get("content", "")
                 )
             elif name == "list_directory":
-                files = self.file_ops.list_directory(args.get("path", ""))
+                files = await self.file_ops.list_directory_async(args.get("path", ""))
                 result = "\n".join([
                     f"{'[DIR]' if f.is_dir else '[FILE]'} {f.name}"
                     for f in files
                 ])
             elif name == "execute_python":
                 exec_result = await self.code_executor.execute_python(
-                    args.get("code", "")
+                    args.get("code", ""),
+                    on_output
                 )
                 result = f"Output: {exec_result.output}\n"
                 if exec_result.error:
@@ -130,7 +193,8 @@ class Agent:
                 result += f"Return code: {exec_result.return_code}"
             elif name == "execute_shell":
                 exec_result = await self.code_executor.execute_shell(
-                    args.get("command", "")
+                    args.get("command", ""),
+                    on_output
                 )
                 result = f"Output: {exec_result.output}\n"
                 if exec_result.error:
@@ -144,6 +208,30 @@ class Agent:
         tool_call.result = result
         return result
     
+    def _dispatch_tool(
+        self,
+        tool_call: ToolCall,
+        after: Optional[asyncio.Task] = None,
+        output: Optional[asyncio.Queue] = None,
+        index: int = 0
+    ) -> asyncio.Task:
+        """Start a tool call in the background, optionally once another task is done"""
+        def on_output(stream: str, content: str):
+            output.put_nowait({
+                "type": "tool_output",
+                "index": index,
+                "name": tool_call.name,
+                "stream": stream,
+                "content": content
+            })
+        
+        async def run() -> str:
+            if after is not None:
+                await after
+            return await self._execute_tool(tool_call, on_output if output else None)
+        
+        return asyncio.create_task(run())
+    
     async def chat(
         self,
         message: str,
@@ -152,65 +240,112 @@ class Agent:
         """Process a user message with potential tool calls"""
         
         # Add user message to conversation
-        self.conversation.append(ChatMessage(role="user", content=message))
+        self._remember("user", message)
         
         # Build messages with system prompt
-        messages = [
-            ChatMessage(role="system", content=SYSTEM_PROMPT),
-            *self.conversation
-        ]
+        messages = [_SYSTEM_MSG, *self.conversation]
         
         iteration = 0
         full_response = ""
+        # Numbers the tool calls of this turn so the UI can route each event to its box
+        tool_count = 0
+        
+        # Tools still running when the turn ends early (e.g. the client left)
+        # are cancelled rather than left to finish unobserved
+        tasks: List[asyncio.Task] = []
+        pending: Optional[asyncio.Future] = None
+        getter: Optional[asyncio.Future] = None
         
-        while iteration < self.max_iterations:
-            iteration += 1
-            self.status = AgentStatus.THINKING
-            
-            yield {"type": "status", "status": "thinking", "iteration": iteration}
-            
-            # Get response from model
-            current_response = ""
-            async for chunk in self.orchestrator.chat_stream(messages, model):
-                current_response += chunk
-                yield {"type": "chunk", "content": chunk}
-            
-            full_response += current_response
-            
-            # Check for tool calls
-            tool_calls = self._parse_tool_calls(current_response)
-            
-            if not tool_calls:
-                # No tools to call, we're done
-                break
-            
-            # Execute tools
-            self.status = AgentStatus.TOOL_CALLING
-            tool_results = []
-            
-            for tool_call in tool_calls:
-                yield {
-                    "type": "tool_call",
-                    "name": tool_call.name,
-                    "arguments": tool_call.arguments
-                }
+        try:
+            while iteration < self.max_iterations:
+                iteration += 1
+                self.status = AgentStatus.THINKING
+                
+                yield {"type": "status", "status": "thinking", "iteration": iteration}
                 
-                result = await self._execute_tool(tool_call)
-                tool_results.append(f"Tool '{tool_call.name}' result:\n{result}")
+                # Get response from model, starting each tool as soon as its block closes
+                current_response = ""
+                scan_pos = 0
+                tool_calls: List[ToolCall] = []
+                tasks = []
+                pending = None
+                last_ordered: Optional[asyncio.Task] = None
+                output: asyncio.Queue = asyncio.Queue()
                 
-                yield {
-                    "type": "tool_result",
-                    "name": tool_call.name,
-                    "result": result
-                }
-            
-            # Add tool results to conversation
-            tool_message = "\n\n".join(tool_results)
-            messages.append(ChatMessage(role="assistant", content=current_response))
-            messages.append(ChatMessage(role="user", content=f"Résultats des outils:\n\n{tool_message}\n\nContinue ta réponse."))
+                async with aclosing(self.orchestrator.chat_stream(messages, model)) as chunks:
+                    async for chunk in chunks:
+                        current_response += chunk
+                        yield {"type": "chunk", "content": chunk}
+                        
+                        # Only text past the cursor is scanned again
+                        new_calls, scan_pos = self._scan_tool_calls(current_response, scan_pos)
+                        for tool_call in new_calls:
+                            index = tool_count + len(tool_calls)
+                            # File and code tools run one after another in the order they were
+                            # written, so "write then run" sees the write; searches overlap them
+                            if tool_call.name in _CONCURRENT_TOOLS:
+                                task = self._dispatch_tool(tool_call, output=output, index=index)
+                            else:
+                                task = self._dispatch_tool(tool_call, after=last_ordered, output=output, index=index)
+                                last_ordered = task
+                            tool_calls.append(tool_call)
+                            tasks.append(task)
+                
+                full_response += current_response
+                
+                if not tool_calls:
+                    # No tools to call, we're done
+                    break
+                
+                # Execute tools
+                self.status = AgentStatus.TOOL_CALLING
+                tool_results = []
+                
+                for index, tool_call in enumerate(tool_calls, tool_count):
+                    yield {
+                        "type": "tool_call",
+                        "index": index,
+                        "name": tool_call.name,
+                        "arguments": tool_call.arguments
+                    }
+                
+                # Forward live tool output until every tool has finished
+                pending = asyncio.gather(*tasks)
+                while not pending.done() or not output.empty():
+                    if output.empty():
+                        getter = asyncio.ensure_future(output.get())
+                        await asyncio.wait({pending, getter}, return_when=asyncio.FIRST_COMPLETED)
+                        if not getter.done():
+                            getter.cancel()
+                            continue
+                        yield getter.result()
+                    else:
+                        yield output.get_nowait()
+                results = pending.result()
+                
+                for index, (tool_call, result) in enumerate(zip(tool_calls, results), tool_count):
+                    tool_results.append(f"Tool '{tool_call.name}' result:\n{result}")
+                    
+                    yield {
+                        "type": "tool_result",
+                        "index": index,
+                        "name": tool_call.name,
+                        "result": result
+                    }
+                tool_count += len(tool_calls)
+                
+                # Add tool results to conversation
+                tool_message = "\n\n".join(tool_results)
+                messages.append(ChatMessage(role="assistant", content=current_response))
+                messages.append(ChatMessage(role="user", content=f"Résultats des outils:\n\n{tool_message}\n\nContinue ta réponse."))
+        finally:
+            leftovers = [f for f in (*tasks, pending, getter) if f is not None and not f.done()]
+            for f in leftovers:
+                f.cancel()
+            await asyncio.gather(*leftovers, return_exceptions=True)
         
         # Add final response to conversation
-        self.conversation.append(ChatMessage(role="assistant", content=full_response))
+        self._remember("assistant", full_response)
         self.status = AgentStatus.IDLE
         
         yield {"type": "done", "full_response": full_response}
@@ -221,26 +356,34 @@ class Agent:
         model: Optional[str] = None
     ) -> str:
         """Simple chat without tool calling"""
-        self.conversation.append(ChatMessage(role="user", content=message))
+        self._remember("user", message)
         
-        messages = [
-            ChatMessage(role="system", content="Tu es Antigravity Ultra, une IA utile et précise. Réponds en français."),
-            *self.conversation
-        ]
+        messages = [_SIMPLE_SYSTEM_MSG, *self.conversation]
         
         response = await self.orchestrator.chat(messages, model)
-        self.conversation.append(ChatMessage(role="assistant", content=response.content))
+        self._remember("assistant", response.content)
         
         return response.content
     
     def clear_conversation(self):
         """Clear conversation history"""
-        self.conversation = []
+        self.conversation.clear()
+        self._history_tokens = 0
+    
+    async def warmup(self):
+        """Prepare tools so the first tool call doesn't pay their startup cost"""
+        tasks = []
+        if config.enable_code_execution:
+            tasks.append(self.code_executor.warmup())
+        if config.enable_web_search:
+            tasks.append(self.web_search.warmup())
+        await asyncio.gather(*tasks)
     
     async def close(self):
         """Cleanup resources"""
+        # The orchestrator is shared, its owner closes it (close_orchestrator)
         await self.web_search.close()
-        await self.orchestrator.close()
+        await self.code_executor.close()
 
 
 # Global agent instance
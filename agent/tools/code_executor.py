@@ -1,9 +1,13 @@
 # Antigravity Ultra - Agent Tools: Code Executor
 import subprocess
 import tempfile
+import codecs
 import os
 import sys
-from typing import Tuple
+import json
+import signal
+import struct
+from typing import Tuple, Optional, List, Callable
 from dataclasses import dataclass
 import asyncio
 
@@ -16,65 +20,351 @@ class ExecutionResult:
     return_code: int
 
 
+# Receives ("stdout" | "stderr", text) as a process produces output
+OutputCallback = Callable[[str, str], None]
+
+
+# Fork server run by the persistent Python worker. Requests and replies are
+# length-prefixed frames on the original stdin/stdout. Each snippet runs in a
+# forked child, so cwd, env, sys.path and builtins changes die with it, and
+# its fds 1 and 2 are pipes: output from print, subprocesses and C code alike
+# is sent as ["stdout" | "stderr", text] frames, preceded by ["pid", pid] and
+# followed by ["rc", exit code].
+_WORKER_SCRIPT = r"""
+import atexit, builtins, codecs, ctypes, json, os, selectors, struct, sys, traceback
+
+proto_in = os.fdopen(os.dup(0), "rb")
+proto_out = os.fdopen(os.dup(1), "wb")
+devnull = os.open(os.devnull, os.O_RDWR)
+os.dup2(devnull, 0)
+os.dup2(devnull, 1)
+
+
+def send(kind, value):
+    frame = json.dumps([kind, value]).encode("utf-8")
+    proto_out.write(struct.pack(">I", len(frame)) + frame)
+    proto_out.flush()
+
+
+def run(code):
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    try:
+        exec(compile(code, "<string>", "exec"), {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Drop the dispatcher's own frame from the traceback
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        return 1
+    return 0
+
+
+def child(code, out_w, err_w):
+    proto_in.close()
+    proto_out.close()
+    os.dup2(out_w, 1)
+    os.dup2(err_w, 2)
+    rc = 1
+    try:
+        rc = run(code)
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        # Flush what C code buffered in stdio, which os._exit would drop
+        try:
+            ctypes.CDLL(None).fflush(None)
+        except Exception:
+            pass
+        os._exit(rc & 0xFF)
+
+
+while True:
+    header = proto_in.read(4)
+    if len(header) < 4:
+        break
+    code = proto_in.read(struct.unpack(">I", header)[0]).decode("utf-8")
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        child(code, out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+    send("pid", pid)
+
+    # Forward both pipes until every writer, grandchildren included, closed them
+    streams = {
+        out_r: ("stdout", codecs.getincrementaldecoder("utf-8")("replace")),
+        err_r: ("stderr", codecs.getincrementaldecoder("utf-8")("replace")),
+    }
+    with selectors.DefaultSelector() as selector:
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+        while streams:
+            for key, _ in selector.select():
+                kind, decoder = streams[key.fd]
+                chunk = os.read(key.fd, 65536)
+                text = decoder.decode(chunk, final=not chunk)
+                if text:
+                    send(kind, text)
+                if not chunk:
+                    selector.unregister(key.fd)
+                    os.close(key.fd)
+                    del streams[key.fd]
+    send("rc", os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]))
+"""
+
+
 class CodeExecutor:
     """Safe Python code execution in sandbox"""
     
+    # Longest snippet passed via "-c" (Windows caps command lines at 32K chars)
+    MAX_ARG_CODE = 8192
+    # Bytes read from a subprocess pipe at a time
+    READ_CHUNK_SIZE = 4096
+    # The warm worker forks a child per snippet; elsewhere every snippet runs one-shot
+    USE_WORKER = hasattr(os, "fork")
+    # One-shot and shell processes lead their own group so a timeout kills their children too
+    NEW_SESSION = hasattr(os, "killpg")
+    # Seconds to wait for a killed process to be reaped
+    REAP_TIMEOUT = 5
+    
     def __init__(self, timeout: int = 30):
         self.timeout = timeout
         self.python_path = sys.executable
+        self._worker: Optional[asyncio.subprocess.Process] = None
+        self._worker_lock = asyncio.Lock()
     
-    async def execute_python(self, code: str) -> ExecutionResult:
-        """Execute Python code safely"""
-        
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(
-            mode='w', 
-            suffix='.py', 
-            delete=False,
-            encoding='utf-8'
-        ) as f:
-            f.write(code)
-            temp_path = f.name
-        
-        try:
-            # Run in subprocess with timeout
-            process = await asyncio.create_subprocess_exec(
-                self.python_path, temp_path,
+    async def _ensure_worker(self) -> asyncio.subprocess.Process:
+        """Start the persistent Python worker if it isn't running"""
+        if self._worker is None or self._worker.returncode is not None:
+            self._worker = await asyncio.create_subprocess_exec(
+                self.python_path, "-c", _WORKER_SCRIPT,
+                stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
                 cwd=tempfile.gettempdir()
             )
+        return self._worker
+    
+    def _kill_worker(self):
+        """Kill the worker; the next call spawns a fresh one"""
+        if self._worker is not None and self._worker.returncode is None:
+            self._worker.kill()
+        self._worker = None
+    
+    def _kill_snippet(self, pid: Optional[int]):
+        """Kill the worker's child running a snippet"""
+        if pid is not None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+    
+    def _kill_process(self, process: asyncio.subprocess.Process):
+        """Kill a one-shot or shell process along with its process group"""
+        try:
+            if self.NEW_SESSION:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+    
+    async def _read_worker_frame(self, worker: asyncio.subprocess.Process) -> list:
+        """Read one length-prefixed reply frame from the worker"""
+        header = await worker.stdout.readexactly(4)
+        return json.loads(await worker.stdout.readexactly(struct.unpack(">I", header)[0]))
+    
+    async def execute_python(
+        self,
+        code: str,
+        on_output: Optional[OutputCallback] = None
+    ) -> ExecutionResult:
+        """Execute Python code in the warm worker process"""
+        # Concurrent snippets run one-shot rather than queueing behind the worker
+        if not self.USE_WORKER or self._worker_lock.locked():
+            return await self._execute_python_oneshot(code, on_output)
+        
+        async with self._worker_lock:
+            data = code.encode('utf-8')
+            try:
+                worker = await self._ensure_worker()
+                worker.stdin.write(struct.pack(">I", len(data)) + data)
+                await worker.stdin.drain()
+            except (OSError, ConnectionError):
+                # Worker unavailable before the code ran, safe to run it one-shot
+                self._kill_worker()
+                return await self._execute_python_oneshot(code, on_output)
             
+            output = {"stdout": [], "stderr": []}
+            pid = None
+            deadline = asyncio.get_running_loop().time() + self.timeout
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=self.timeout
-                )
-                
-                return ExecutionResult(
-                    success=process.returncode == 0,
-                    output=stdout.decode('utf-8', errors='replace'),
-                    error=stderr.decode('utf-8', errors='replace'),
-                    return_code=process.returncode
-                )
-                
+                while True:
+                    kind, value = await asyncio.wait_for(
+                        self._read_worker_frame(worker),
+                        timeout=deadline - asyncio.get_running_loop().time()
+                    )
+                    if kind == "rc":
+                        break
+                    if kind == "pid":
+                        pid = value
+                        continue
+                    output[kind].append(value)
+                    if on_output:
+                        on_output(kind, value)
             except asyncio.TimeoutError:
-                process.kill()
+                # Killing the worker alone would leave its child running
+                self._kill_snippet(pid)
+                self._kill_worker()
                 return ExecutionResult(
                     success=False,
-                    output="",
+                    output="".join(output["stdout"]),
                     error=f"Execution timed out after {self.timeout} seconds",
                     return_code=-1
                 )
-                
-        finally:
-            # Clean up temp file
+            except asyncio.CancelledError:
+                # The caller gave up on the snippet, e.g. its turn was closed
+                self._kill_snippet(pid)
+                self._kill_worker()
+                raise
+            except asyncio.IncompleteReadError:
+                # The worker itself died
+                self._kill_snippet(pid)
+                self._kill_worker()
+                return ExecutionResult(
+                    success=False,
+                    output="".join(output["stdout"]),
+                    error="Python worker exited unexpectedly",
+                    return_code=-1
+                )
+        
+        return ExecutionResult(
+            success=value == 0,
+            output="".join(output["stdout"]),
+            error="".join(output["stderr"]),
+            return_code=value
+        )
+    
+    async def _pump(
+        self,
+        reader: asyncio.StreamReader,
+        kind: str,
+        parts: List[str],
+        on_output: Optional[OutputCallback]
+    ):
+        """Forward a pipe's output as it arrives"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = await reader.read(self.READ_CHUNK_SIZE)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                parts.append(text)
+                if on_output:
+                    on_output(kind, text)
+            if not chunk:
+                break
+    
+    async def _feed(self, writer: asyncio.StreamWriter, payload: bytes):
+        """Write a payload to a process's stdin and close it"""
+        try:
+            writer.write(payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+    
+    async def _run_process(
+        self,
+        process: asyncio.subprocess.Process,
+        timeout_message: str,
+        on_output: Optional[OutputCallback] = None,
+        payload: Optional[bytes] = None
+    ) -> ExecutionResult:
+        """Collect a subprocess's output, streaming it to on_output"""
+        stdout_parts: List[str] = []
+        stderr_parts: List[str] = []
+        jobs = [
+            self._pump(process.stdout, "stdout", stdout_parts, on_output),
+            self._pump(process.stderr, "stderr", stderr_parts, on_output),
+        ]
+        if payload is not None:
+            jobs.append(self._feed(process.stdin, payload))
+        
+        # The pumps and the exit share one deadline: a command that closes its
+        # pipes early must not outlive it
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*jobs, process.wait()),
+                timeout=self.timeout
+            )
+        except asyncio.CancelledError:
+            # The caller gave up on the command, e.g. its turn was closed
+            self._kill_process(process)
+            raise
+        except asyncio.TimeoutError:
+            self._kill_process(process)
             try:
-                os.unlink(temp_path)
-            except:
+                await asyncio.wait_for(process.wait(), timeout=self.REAP_TIMEOUT)
+            except asyncio.TimeoutError:
                 pass
+            return ExecutionResult(
+                success=False,
+                output="".join(stdout_parts),
+                error=timeout_message,
+                return_code=-1
+            )
+        
+        return ExecutionResult(
+            success=process.returncode == 0,
+            output="".join(stdout_parts),
+            error="".join(stderr_parts),
+            return_code=process.returncode
+        )
+    
+    async def _execute_python_oneshot(
+        self,
+        code: str,
+        on_output: Optional[OutputCallback] = None
+    ) -> ExecutionResult:
+        """Execute Python code in a fresh interpreter"""
+        
+        # Small snippets go on the command line, larger ones through stdin
+        if len(code) <= self.MAX_ARG_CODE:
+            args, stdin, payload = ("-c", code), None, None
+        else:
+            args, stdin, payload = ("-",), asyncio.subprocess.PIPE, code.encode('utf-8')
+        
+        # Run in subprocess with timeout
+        process = await asyncio.create_subprocess_exec(
+            self.python_path, *args,
+            stdin=stdin,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=self.NEW_SESSION,
+            cwd=tempfile.gettempdir()
+        )
+        
+        return await self._run_process(
+            process,
+            f"Execution timed out after {self.timeout} seconds",
+            on_output,
+            payload
+        )
     
-    async def execute_shell(self, command: str) -> ExecutionResult:
+    async def execute_shell(
+        self,
+        command: str,
+        on_output: Optional[OutputCallback] = None
+    ) -> ExecutionResult:
         """Execute a shell command (Windows)"""
         
         try:
@@ -82,30 +372,15 @@ class CodeExecutor:
                 command,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
+                start_new_session=self.NEW_SESSION,
                 cwd=os.path.expanduser("~")
             )
             
-            try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=self.timeout
-                )
-                
-                return ExecutionResult(
-                    success=process.returncode == 0,
-                    output=stdout.decode('utf-8', errors='replace'),
-                    error=stderr.decode('utf-8', errors='replace'),
-                    return_code=process.returncode
-                )
-                
-            except asyncio.TimeoutError:
-                process.kill()
-                return ExecutionResult(
-                    success=False,
-                    output="",
-                    error=f"Command timed out after {self.timeout} seconds",
-                    return_code=-1
-                )
+            return await self._run_process(
+                process,
+                f"Command timed out after {self.timeout} seconds",
+                on_output
+            )
                 
         except Exception as e:
             return ExecutionResult(
@@ -114,6 +389,22 @@ class CodeExecutor:
                 error=str(e),
                 return_code=-1
             )
+    
+    async def warmup(self):
+        """Spawn the persistent worker ahead of the first snippet"""
+        if not self.USE_WORKER:
+            return
+        try:
+            await self._ensure_worker()
+        except OSError as e:
+            print(f"[CodeExecutor] Worker warmup failed: {e}")
+    
+    async def close(self):
+        """Stop the persistent worker"""
+        worker = self._worker
+        self._kill_worker()
+        if worker is not None:
+            await worker.wait()
 
 
 # Tool definition for the agent
@@ -1,8 +1,9 @@
 # Antigravity Ultra - Agent Tools: File Operations
 import os
 import shutil
+import asyncio
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from dataclasses import dataclass
 
 
@@ -18,6 +19,9 @@ class FileInfo:
 class FileOpsTool:
     """Safe file operations tool"""
     
+    # Maximum number of memoized path decisions
+    PATH_CACHE_SIZE = 256
+    
     def __init__(self, allowed_paths: Optional[List[str]] = None):
         # By default, allow user's home and specific directories
         self.allowed_paths = allowed_paths or [
@@ -26,11 +30,30 @@ class FileOpsTool:
             str(Path.home() / "Desktop"),
             str(Path.home() / ".gemini")
         ]
+        # Normalized with a trailing separator so "/home/user" doesn't match "/home/username"
+        self._allowed_prefixes = tuple(
+            os.path.join(os.path.abspath(p), "") for p in self.allowed_paths
+        )
+        self._path_cache: Dict[str, bool] = {}
+        # Resolved once; the agent doesn't chdir during a session
+        self._cwd = os.getcwd()
+    
+    def _abspath(self, path: str) -> str:
+        """Like os.path.abspath, without a getcwd() call per invocation"""
+        if os.path.isabs(path):
+            return os.path.normpath(path)
+        return os.path.normpath(os.path.join(self._cwd, path))
     
     def _is_path_allowed(self, path: str) -> bool:
         """Check if path is in allowed directories"""
-        abs_path = os.path.abspath(path)
-        return any(abs_path.startswith(allowed) for allowed in self.allowed_paths)
+        allowed = self._path_cache.get(path)
+        if allowed is None:
+            abs_path = os.path.join(self._abspath(path), "")
+            allowed = abs_path.startswith(self._allowed_prefixes)
+            if len(self._path_cache) >= self.PATH_CACHE_SIZE:
+                self._path_cache.clear()
+            self._path_cache[path] = allowed
+        return allowed
     
     def read_file(self, path: str) -> str:
         """Read a file's contents"""
@@ -58,18 +81,40 @@ class FileOpsTool:
         if not self._is_path_allowed(path):
             raise PermissionError(f"Access denied: {path}")
         
-        results = []
-        for item in Path(path).iterdir():
-            stat = item.stat()
-            results.append(FileInfo(
-                path=str(item),
-                name=item.name,
-                is_dir=item.is_dir(),
-                size=stat.st_size if item.is_file() else 0,
-                extension=item.suffix if item.is_file() else ""
-            ))
+        # (sort key..., FileInfo) rows; the exact name breaks case-insensitive ties
+        # so FileInfo itself is never compared
+        rows = []
+        # scandir entries carry the file type from the directory read, so only files need a stat
+        # An empty path lists the cwd, as Path("").iterdir() did
+        with os.scandir(path or ".") as entries:
+            for entry in entries:
+                is_file = entry.is_file()
+                is_dir = entry.is_dir()
+                rows.append((not is_dir, entry.name.lower(), entry.name, FileInfo(
+                    path=os.path.join(path, entry.name),
+                    name=entry.name,
+                    is_dir=is_dir,
+                    size=entry.stat().st_size if is_file else 0,
+                    extension=os.path.splitext(entry.name)[1] if is_file else ""
+                )))
         
-        return sorted(results, key=lambda x: (not x.is_dir, x.name.lower()))
+        rows.sort()
+        return [row[3] for row in rows]
+    
+    # Async variants run the blocking I/O in a worker thread so the event loop
+    # keeps serving other tools meanwhile
+    
+    async def read_file_async(self, path: str) -> str:
+        """Read a file's contents without blocking the event loop"""
+        return await asyncio.to_thread(self.read_file, path)
+    
+    async def write_file_async(self, path: str, content: str) -> str:
+        """Write content to a file without blocking the event loop"""
+        return await asyncio.to_thread(self.write_file, path, content)
+    
+    async def list_directory_async(self, path: str) -> List[FileInfo]:
+        """List contents of a directory without blocking the event loop"""
+        return await asyncio.to_thread(self.list_directory, path)
     
     def create_directory(self, path: str) -> str:
         """Create a directory"""
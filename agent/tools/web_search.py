@@ -1,8 +1,12 @@
 # Antigravity Ultra - Agent Tools: Web Search
 import httpx
-from typing import List, Dict, Any
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict
 from dataclasses import dataclass
 import urllib.parse
+from selectolax.lexbor import LexborHTMLParser as HTMLParser
 
 
 @dataclass
@@ -15,17 +19,73 @@ class SearchResult:
 class WebSearchTool:
     """Web search using DuckDuckGo (no API key needed)"""
     
+    # Result cache bounds
+    CACHE_SIZE = 256
+    CACHE_TTL = 300  # seconds
+    # Warmup runs during app startup, so an unreachable host must not hold it up
+    WARMUP_TIMEOUT = 2.0  # seconds
+    
     def __init__(self):
+        # Keep-alive pool and HTTP/2 so repeat searches reuse one TLS connection;
+        # brotli/gzip shrink the HTML we download and parse
         self.client = httpx.AsyncClient(
             headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+                "Accept-Encoding": "br, gzip"
             },
             timeout=30.0,
-            follow_redirects=True
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=20,
+                max_keepalive_connections=10,
+                keepalive_expiry=60
+            )
         )
+        # (query, num_results) -> (expiry, results), oldest first
+        self._cache: OrderedDict = OrderedDict()
+        # (query, num_results) -> future of a fetch already underway
+        self._inflight: Dict[tuple, asyncio.Future] = {}
     
     async def search(self, query: str, num_results: int = 5) -> List[SearchResult]:
-        """Search the web using DuckDuckGo"""
+        """Search the web using DuckDuckGo, serving repeats from a TTL cache"""
+        key = (query, num_results)
+        cached = self._cache.get(key)
+        if cached is not None:
+            expiry, results = cached
+            if expiry > time.monotonic():
+                self._cache.move_to_end(key)
+                return list(results)
+            del self._cache[key]
+        
+        # Identical concurrent searches share a single request
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return list(await asyncio.shield(inflight))
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            results = await self._fetch(query, num_results)
+        except BaseException:
+            # Waiting callers get what a failed fetch returns; cancelling the future
+            # would raise CancelledError in them and tear down their agent turn
+            future.set_result([])
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(results)
+        
+        # Empty results are usually errors, don't pin them for the TTL
+        if results:
+            self._cache[key] = (time.monotonic() + self.CACHE_TTL, results)
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        
+        return list(results)
+    
+    async def _fetch(self, query: str, num_results: int) -> List[SearchResult]:
+        """Fetch and parse results from DuckDuckGo"""
         results = []
         
         try:
@@ -47,26 +107,18 @@ class WebSearchTool:
         """Parse DuckDuckGo HTML results"""
         results = []
         
-        # Find result blocks
-        import re
+        # Single pass over the DOM; text() already strips inner tags
+        tree = HTMLParser(html)
+        links = tree.css('a.result__a')[:num_results]
+        snippets = tree.css('a.result__snippet')
         
-        # Extract result links and titles
-        pattern = r'<a rel="nofollow" class="result__a" href="([^"]+)"[^>]*>([^<]+)</a>'
-        matches = re.findall(pattern, html)
-        
-        # Extract snippets
-        snippet_pattern = r'<a class="result__snippet"[^>]*>([^<]+(?:<b>[^<]+</b>[^<]*)*)</a>'
-        snippets = re.findall(snippet_pattern, html)
-        
-        for i, (url, title) in enumerate(matches[:num_results]):
-            snippet = snippets[i] if i < len(snippets) else ""
-            # Clean up snippet
-            snippet = re.sub(r'<[^>]+>', '', snippet)
+        for i, link in enumerate(links):
+            snippet = snippets[i].text().strip() if i < len(snippets) else ""
             
             results.append(SearchResult(
-                title=title.strip(),
-                url=url,
-                snippet=snippet.strip()
+                title=link.text().strip(),
+                url=link.attributes.get('href') or "",
+                snippet=snippet
             ))
         
         return results
@@ -78,13 +130,23 @@ class WebSearchTool:
         if not results:
             return f"No results found for: {query}"
         
-        formatted = f"Search results for: {query}\n\n"
-        for i, r in enumerate(results, 1):
-            formatted += f"{i}. **{r.title}**\n"
-            formatted += f"   URL: {r.url}\n"
-            formatted += f"   {r.snippet}\n\n"
+        parts = [f"Search results for: {query}\n\n"]
+        parts.extend(
+            f"{i}. **{r.title}**\n   URL: {r.url}\n   {r.snippet}\n\n"
+            for i, r in enumerate(results, 1)
+        )
         
-        return formatted
+        return "".join(parts)
+    
+    async def warmup(self):
+        """Open the DuckDuckGo connection (DNS, TLS) ahead of the first search"""
+        try:
+            await self.client.head(
+                "https://html.duckduckgo.com/html/",
+                timeout=self.WARMUP_TIMEOUT
+            )
+        except Exception as e:
+            print(f"Search warmup error: {e}")
     
     async def close(self):
         await self.client.aclose()
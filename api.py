@@ -12,11 +12,12 @@ from fastapi.responses import HTMLResponse, FileResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import uuid
-import json
+import orjson
 import asyncio
+import time
 
 from config import config, MODELS
-from models import orchestrator, ChatMessage
+from models import get_orchestrator, close_orchestrator, ChatMessage
 from agent import agent
 from memory import memory
 
@@ -34,6 +35,18 @@ class ConversationCreate(BaseModel):
     title: str = ""
 
 
+# === Streaming ===
+
+# Chunks are coalesced into one frame per batch to cut per-token send overhead
+CHUNK_BATCH_SIZE = 16
+CHUNK_FLUSH_INTERVAL = 0.02  # seconds
+
+
+async def send_json(websocket: WebSocket, data: Dict[str, Any]):
+    """Send a JSON text frame encoded with orjson"""
+    await websocket.send_text(orjson.dumps(data).decode())
+
+
 # === FastAPI App ===
 
 app = FastAPI(
@@ -47,8 +60,12 @@ app = FastAPI(
 
 @app.on_event("startup")
 async def startup():
-    """Connect to database on startup"""
-    await memory.connect()
+    """Connect to database and warm up providers and tools on startup"""
+    await asyncio.gather(
+        memory.connect(),
+        get_orchestrator().warmup(),
+        agent.warmup()
+    )
     print("[API] Database connected")
 
 
@@ -66,7 +83,7 @@ async def health():
 @app.get("/api/models")
 async def list_models():
     """List available models"""
-    available = await orchestrator.get_available_models()
+    available = await get_orchestrator().get_available_models()
     
     models_info = []
     for provider, model_list in available.items():
@@ -140,7 +157,7 @@ async def websocket_chat(websocket: WebSocket):
         while True:
             # Receive message
             data = await websocket.receive_text()
-            request = json.loads(data)
+            request = orjson.loads(data)
             
             message = request.get("message", "")
             conv_id = request.get("conversation_id") or str(uuid.uuid4())
@@ -151,7 +168,7 @@ async def websocket_chat(websocket: WebSocket):
             await memory.add_message(conv_id, "user", message)
             
             # Send conversation ID
-            await websocket.send_json({
+            await send_json(websocket, {
                 "type": "conversation_id",
                 "conversation_id": conv_id
             })
@@ -159,31 +176,60 @@ async def websocket_chat(websocket: WebSocket):
             if use_agent:
                 # Use agent with tools
                 full_response = ""
+                pending: List[str] = []
+                last_flush = time.monotonic()
+                
+                async def flush():
+                    nonlocal last_flush
+                    if pending:
+                        await send_json(websocket, {
+                            "type": "chunks",
+                            "contents": pending.copy()
+                        })
+                        pending.clear()
+                    last_flush = time.monotonic()
+                
                 async for event in agent.chat(message, model):
                     if event["type"] == "chunk":
                         full_response += event["content"]
-                        await websocket.send_json({
-                            "type": "chunk",
-                            "content": event["content"]
-                        })
+                        pending.append(event["content"])
+                        if (len(pending) >= CHUNK_BATCH_SIZE
+                                or time.monotonic() - last_flush > CHUNK_FLUSH_INTERVAL):
+                            await flush()
                     elif event["type"] == "tool_call":
-                        await websocket.send_json({
+                        await flush()
+                        await send_json(websocket, {
                             "type": "tool_call",
                             "name": event["name"],
-                            "arguments": event["arguments"]
+                            "arguments": event["arguments"],
+                            "index": event["index"]
+                        })
+                    elif event["type"] == "tool_output":
+                        await flush()
+                        await send_json(websocket, {
+                            "type": "tool_output",
+                            "name": event["name"],
+                            "stream": event["stream"],
+                            "content": event["content"],
+                            "index": event["index"]
                         })
                     elif event["type"] == "tool_result":
-                        await websocket.send_json({
+                        await flush()
+                        await send_json(websocket, {
                             "type": "tool_result",
                             "name": event["name"],
-                            "result": event["result"][:500]  # Truncate for display
+                            "result": event["result"][:500],  # Truncate for display
+                            "index": event["index"]
                         })
                     elif event["type"] == "status":
-                        await websocket.send_json({
+                        await flush()
+                        await send_json(websocket, {
                             "type": "status",
                             "status": event["status"]
                         })
                 
+                await flush()
+                
                 # Save assistant response
                 await memory.add_message(conv_id, "assistant", full_response)
             else:
@@ -191,7 +237,7 @@ async def websocket_chat(websocket: WebSocket):
                 response = await agent.simple_chat(message, model)
                 
                 # Send as single chunk
-                await websocket.send_json({
+                await send_json(websocket, {
                     "type": "chunk",
                     "content": response
                 })
@@ -200,12 +246,12 @@ async def websocket_chat(websocket: WebSocket):
                 await memory.add_message(conv_id, "assistant", response)
             
             # Signal completion
-            await websocket.send_json({"type": "done"})
+            await send_json(websocket, {"type": "done"})
             
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "error",
             "message": str(e)
         })
@@ -233,3 +279,4 @@ async def root():
 async def shutdown():
     await memory.disconnect()
     await agent.close()
+    await close_orchestrator()
@@ -1,49 +1,56 @@
 # Antigravity Ultra - Configuration
 import os
 from dataclasses import dataclass, field
-from typing import Optional, Dict, List
+from typing import Optional, Mapping, Tuple
+from types import MappingProxyType
 from pathlib import Path
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ModelInfo:
     """Information about an LLM model"""
     name: str
     provider: str
     context_length: int
     speed: str  # "fast", "medium", "slow"
-    capabilities: List[str] = field(default_factory=list)
+    capabilities: Tuple[str, ...] = ()
 
 
-# Available models configuration
-MODELS: Dict[str, ModelInfo] = {
+# Available models configuration (read-only)
+MODELS: Mapping[str, ModelInfo] = MappingProxyType({
     # Groq (FREE & Ultra-fast)
     "llama-3.1-70b-versatile": ModelInfo(
         "llama-3.1-70b-versatile", "groq", 131072, "fast",
-        ["chat", "code", "analysis", "reasoning"]
+        ("chat", "code", "analysis", "reasoning")
     ),
     "llama-3.1-8b-instant": ModelInfo(
         "llama-3.1-8b-instant", "groq", 131072, "fast",
-        ["chat", "quick-tasks"]
+        ("chat", "quick-tasks")
     ),
     "mixtral-8x7b-32768": ModelInfo(
         "mixtral-8x7b-32768", "groq", 32768, "fast",
-        ["chat", "code", "multilingual"]
+        ("chat", "code", "multilingual")
     ),
     "gemma2-9b-it": ModelInfo(
         "gemma2-9b-it", "groq", 8192, "fast",
-        ["chat", "quick-tasks"]
+        ("chat", "quick-tasks")
     ),
     # Ollama (Local)
     "ollama/llama3.1": ModelInfo(
         "llama3.1", "ollama", 128000, "medium",
-        ["chat", "code", "offline"]
+        ("chat", "code", "offline")
     ),
     "ollama/mistral": ModelInfo(
         "mistral", "ollama", 32000, "medium",
-        ["chat", "code", "offline"]
+        ("chat", "code", "offline")
     ),
-}
+})
+
+# Model ids per provider, computed once instead of filtering MODELS per request
+MODELS_BY_PROVIDER: Mapping[str, Tuple[str, ...]] = MappingProxyType({
+    provider: tuple(k for k, v in MODELS.items() if v.provider == provider)
+    for provider in ("groq", "ollama")
+})
 
 
 @dataclass
@@ -63,12 +70,17 @@ class Config:
     fast_model: str = "llama-3.1-8b-instant"
     code_model: str = "llama-3.1-70b-versatile"
     
+    # Provider settings
+    ollama_keep_alive: str = "30m"  # Keeps the model and its prompt cache loaded
+    hedge_delay_s: float = 2.0  # Head start Groq gets before Ollama joins a hedged request
+    
     # Server settings
     host: str = "0.0.0.0"
     port: int = field(default_factory=lambda: int(os.getenv("PORT", "8000")))
     
     # Agent settings
     max_iterations: int = 10
+    max_history_tokens: int = 8000  # Approximate budget for remembered conversation
     enable_code_execution: bool = True
     enable_web_search: bool = True
     enable_file_ops: bool = True
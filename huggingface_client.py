@@ -1,22 +1,32 @@
 # Antigravity Ultra - HuggingFace Free LLM Client
 import httpx
-from typing import AsyncGenerator, Optional, List
+import asyncio
+import time
+from typing import AsyncGenerator, Optional, List, Tuple, Dict, Set
+from contextlib import aclosing
 from dataclasses import dataclass
-import json
+import orjson
 
+from config import config
+from streaming import iter_sse
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class ChatMessage:
     role: str
     content: str
 
 
-@dataclass 
+@dataclass(slots=True, frozen=True)
 class ModelResponse:
     content: str
     model: str
-    tokens_used: int
     finish_reason: str
+    
+    @property
+    def tokens_used(self) -> int:
+        """Estimated from the length (~4 characters per token); the API reports no usage"""
+        return max(1, len(self.content) // 4)
 
 
 class HuggingFaceClient:
@@ -30,31 +40,152 @@ class HuggingFaceClient:
         "mistralai/Mistral-7B-Instruct-v0.2"
     ]
     
+    # Attempts per model while it answers 503 (loading) or the connection fails,
+    # with exponential backoff between them
+    MAX_ATTEMPTS = 3
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 4.0
+    
+    # Seconds a model that answered 503 is skipped before being tried again
+    LOADING_COOLDOWN = 60
+    
+    # Prompt tag for each message role; other roles are left out
+    _TEMPLATES = {
+        "system": "<|system|>\n{}\n",
+        "user": "<|user|>\n{}\n",
+        "assistant": "<|assistant|>\n{}\n"
+    }
+    
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key
         self.current_model_index = 0
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-        
-        self.client = httpx.AsyncClient(timeout=120.0, headers=headers)
+        self._client: Optional[httpx.AsyncClient] = None
         self._available = True
+        # Messages and formatted parts of the last prompt; the next turn usually
+        # resends the same history, so only its new messages need formatting
+        self._prefix_keys: List[Tuple[str, str]] = []
+        self._prefix_parts: List[str] = []
+        # Model -> time.time() of its last 503, kept across restarts
+        self._health_path = config.data_dir / "hf_health.json"
+        self._health: Dict[str, float] = self._load_health()
+        # Pending writes of the health file; the lock keeps them in order
+        self._health_saves: Set[asyncio.Task] = set()
+        self._health_lock = asyncio.Lock()
         print("[HuggingFace] Free inference client initialized with fallback models")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, created on first request"""
+        if self._client is None:
+            headers = {
+                "Content-Type": "application/json",
+                "Accept-Encoding": "br, gzip"
+            }
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(120.0, connect=5.0),
+                limits=httpx.Limits(
+                    max_keepalive_connections=20,
+                    max_connections=100,
+                    keepalive_expiry=30
+                ),
+                http2=True,
+                headers=headers
+            )
+        return self._client
+    
     def is_available(self) -> bool:
         return self._available
     
+    def _load_health(self) -> Dict[str, float]:
+        """Read the persisted loading times, if any"""
+        try:
+            data = orjson.loads(self._health_path.read_bytes())
+            return {k: float(v) for k, v in data.items() if k in self.FREE_MODELS}
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def _set_health(self, model_name: str, loading: bool):
+        """Record whether a model is loading and persist the change in the background"""
+        if loading:
+            self._health[model_name] = time.time()
+        elif self._health.pop(model_name, None) is None:
+            return
+        # Called mid-request, so the file is written off the event loop
+        task = asyncio.create_task(self._save_health(orjson.dumps(self._health)))
+        self._health_saves.add(task)
+        task.add_done_callback(self._health_saves.discard)
+    
+    async def _save_health(self, data: bytes):
+        """Write a snapshot of the loading times in a worker thread"""
+        async with self._health_lock:
+            try:
+                await asyncio.to_thread(self._health_path.write_bytes, data)
+            except OSError as e:
+                print(f"[HuggingFace] Could not save model health: {e}")
+    
+    def _candidates(self) -> List[str]:
+        """Models to try: healthy ones first, recently loading ones skipped"""
+        now = time.time()
+        ranked = sorted(self.FREE_MODELS, key=lambda m: self._health.get(m, 0.0))
+        ready = [m for m in ranked if now - self._health.get(m, 0.0) >= self.LOADING_COOLDOWN]
+        # If every model is cooling down, still try them, oldest 503 first
+        return ready or ranked
+    
     def _format_prompt(self, messages: List[ChatMessage]) -> str:
         """Format messages for instruction-tuned models"""
-        prompt = ""
-        for msg in messages:
-            if msg.role == "system":
-                prompt += f"<|system|>\n{msg.content}\n"
-            elif msg.role == "user":
-                prompt += f"<|user|>\n{msg.content}\n"
-            elif msg.role == "assistant":
-                prompt += f"<|assistant|>\n{msg.content}\n"
-        return prompt + "<|assistant|>\n"
+        templates = self._TEMPLATES
+        keys = [(msg.role, msg.content) for msg in messages if msg.role in templates]
+        
+        # Reuse the parts formatted for the prefix shared with the previous call
+        shared = 0
+        for previous, current in zip(self._prefix_keys, keys):
+            if previous != current:
+                break
+            shared += 1
+        parts = self._prefix_parts[:shared]
+        parts.extend(templates[role].format(content) for role, content in keys[shared:])
+        
+        self._prefix_keys = keys
+        self._prefix_parts = parts
+        return "".join(parts) + "<|assistant|>\n"
+    
+    def _payload(
+        self,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False
+    ) -> dict:
+        """Build the text-generation request body"""
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "max_new_tokens": max_tokens,
+                "temperature": temperature,
+                "return_full_text": False,
+                "do_sample": True
+            }
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+    
+    async def _post_with_retry(self, url: str, payload: dict) -> httpx.Response:
+        """POST, retrying with backoff while the model is loading"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            last = attempt == self.MAX_ATTEMPTS - 1
+            try:
+                response = await self.client.post(url, json=payload)
+            except httpx.TransportError:
+                if last:
+                    raise
+            else:
+                if response.status_code != 503 or last:
+                    return response
+            await asyncio.sleep(min(self.BACKOFF_BASE * 2 ** attempt, self.BACKOFF_MAX))
     
     async def chat(
         self,
@@ -65,29 +196,24 @@ class HuggingFaceClient:
     ) -> ModelResponse:
         """Send a chat completion request with fallback"""
         
+        # The prompt is the same for every model, format it once
+        prompt = self._format_prompt(messages)
+        
         # Try models in sequence
-        for model_name in self.FREE_MODELS:
+        for model_name in self._candidates():
             try:
                 print(f"[HuggingFace] Trying model: {model_name}")
                 url = f"https://api-inference.huggingface.co/models/{model_name}"
-                prompt = self._format_prompt(messages)
                 
-                response = await self.client.post(
+                response = await self._post_with_retry(
                     url,
-                    json={
-                        "inputs": prompt,
-                        "parameters": {
-                            "max_new_tokens": max_tokens,
-                            "temperature": temperature,
-                            "return_full_text": False,
-                            "do_sample": True
-                        }
-                    }
+                    self._payload(prompt, temperature, max_tokens)
                 )
                 
-                # If model is loading (503), wait or skip
+                # Still loading after the retries, skip
                 if response.status_code == 503:
                     print(f"[HuggingFace] Model {model_name} loading, trying next...")
+                    self._set_health(model_name, loading=True)
                     continue
                     
                 response.raise_for_status()
@@ -98,10 +224,10 @@ class HuggingFaceClient:
                 else:
                     content = data.get("generated_text", str(data))
                 
+                self._set_health(model_name, loading=False)
                 return ModelResponse(
                     content=content,
                     model=model_name,
-                    tokens_used=len(content.split()),
                     finish_reason="stop"
                 )
                 
@@ -119,25 +245,55 @@ class HuggingFaceClient:
         max_tokens: int = 2048
     ) -> AsyncGenerator[str, None]:
         """Stream chat response with fallback"""
+        prompt = self._format_prompt(messages)
+        payload = self._payload(prompt, temperature, max_tokens, stream=True)
+        error: Optional[Exception] = None
         
-        # Use existing chat method to get full response, then simulate stream
-        # This is safer for free API which often doesn't support streaming well
-        try:
-            response = await self.chat(messages, model, temperature, max_tokens)
-            content = response.content
-            
-            # Yield word by word
-            words = content.split()
-            for i, word in enumerate(words):
-                yield word + (" " if i < len(words) - 1 else "")
+        for model_name in self._candidates():
+            streamed = False
+            try:
+                print(f"[HuggingFace] Streaming from model: {model_name}")
+                url = f"https://api-inference.huggingface.co/models/{model_name}"
+                
+                async with self.client.stream(
+                    "POST",
+                    url,
+                    json=payload,
+                    headers={"Accept": "text/event-stream"}
+                ) as response:
+                    if response.status_code == 503:
+                        print(f"[HuggingFace] Model {model_name} loading, trying next...")
+                        error = RuntimeError(f"Model {model_name} is loading")
+                        self._set_health(model_name, loading=True)
+                        continue
+                    response.raise_for_status()
+                    
+                    # Server-sent events: one "data:{...}" frame per generated token
+                    async with aclosing(iter_sse(response)) as events:
+                        async for data in events:
+                            chunk = orjson.loads(data)
+                            if "error" in chunk:
+                                raise RuntimeError(chunk["error"])
+                            token = chunk.get("token") or {}
+                            if token.get("text") and not token.get("special"):
+                                streamed = True
+                                yield token["text"]
+                self._set_health(model_name, loading=False)
+                return
                 
-        except Exception as e:
-            print(f"[HuggingFace] Stream error: {e}")
-            yield f"Erreur (Tous les modèles gratuits ont échoué): {str(e)}"
+            except Exception as e:
+                print(f"[HuggingFace] Stream error with {model_name}: {e}")
+                error = e
+                # Falling back mid-answer would repeat what was already sent
+                if streamed:
+                    break
+        
+        yield f"Erreur (Tous les modèles gratuits ont échoué): {str(error)}"
     
     async def close(self):
-        await self.client.aclose()
-
-
-# Global instance
-huggingface_client = HuggingFaceClient()
+        # Let pending health writes land before shutdown
+        if self._health_saves:
+            await asyncio.gather(*self._health_saves)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
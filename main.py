@@ -6,7 +6,6 @@ from pathlib import Path
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-import uvicorn
 from config import config
 
 
@@ -43,7 +42,8 @@ def main():
         print("   Obtenir une clé gratuite: https://console.groq.com")
         print()
     
-    # Start server
+    # Start server (uvicorn is only imported once we actually serve)
+    import uvicorn
     uvicorn.run(
         "api:app",
         host=config.host,
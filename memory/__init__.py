@@ -1,4 +1,18 @@
 # Antigravity Ultra - Memory Package
-from .memory import MemoryManager, memory, ConversationMessage, Conversation
+import importlib
 
 __all__ = ['MemoryManager', 'memory', 'ConversationMessage', 'Conversation']
+
+
+def __getattr__(name):
+    """Import the memory module (databases + SQLAlchemy) on first use"""
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(".memory", __name__)
+    # Importing the submodule binds it as our "memory" attribute; drop that
+    # so the name still resolves to the MemoryManager instance
+    if globals().get("memory") is module:
+        del globals()["memory"]
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
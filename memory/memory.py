@@ -1,9 +1,12 @@
 # Antigravity Ultra - Memory System
+import asyncio
+import contextlib
 import databases
 import sqlalchemy
-import json
+from sqlalchemy.dialects import postgresql, sqlite
+import orjson
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from dataclasses import dataclass
 import sys
@@ -13,7 +16,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import config
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ConversationMessage:
     id: Optional[int]
     conversation_id: str
@@ -23,7 +26,7 @@ class ConversationMessage:
     metadata: Dict[str, Any] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Conversation:
     id: str
     title: str
@@ -40,8 +43,8 @@ conversations = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
     sqlalchemy.Column("title", sqlalchemy.String, default=""),
-    sqlalchemy.Column("created_at", sqlalchemy.DateTime, default=datetime.utcnow),
-    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, default=datetime.utcnow),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime, server_default=sqlalchemy.func.current_timestamp()),
+    sqlalchemy.Column("updated_at", sqlalchemy.DateTime, server_default=sqlalchemy.func.current_timestamp()),
 )
 
 messages = sqlalchemy.Table(
@@ -51,17 +54,130 @@ messages = sqlalchemy.Table(
     sqlalchemy.Column("conversation_id", sqlalchemy.String, sqlalchemy.ForeignKey("conversations.id"), nullable=False),
     sqlalchemy.Column("role", sqlalchemy.String, nullable=False),
     sqlalchemy.Column("content", sqlalchemy.Text, nullable=False),
-    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, default=datetime.utcnow),
+    sqlalchemy.Column("timestamp", sqlalchemy.DateTime, server_default=sqlalchemy.func.current_timestamp()),
     sqlalchemy.Column("metadata", sqlalchemy.Text, default="{}"),
+    # Serves both the per-conversation filter and the ORDER BY timestamp
+    sqlalchemy.Index("idx_messages_conv_ts", "conversation_id", "timestamp"),
 )
 
 
+# Applied once to the pinned SQLite connection: WAL drops the rollback-journal
+# fsync pair per write, NORMAL sync is safe under WAL
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+]
+
+# Full-text index over message content, kept in sync with the messages table
+# by triggers (PostgreSQL keeps using ILIKE)
+SQLITE_FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+# Touch the conversation's updated_at whenever a message is added, so
+# add_message doesn't need its own UPDATE
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS trg_msg_touch AFTER INSERT ON messages BEGIN
+        UPDATE conversations SET updated_at = NEW.timestamp WHERE id = NEW.conversation_id;
+    END""",
+]
+
+POSTGRES_TRIGGERS = [
+    """CREATE OR REPLACE FUNCTION touch_conversation() RETURNS trigger AS $$
+    BEGIN
+        UPDATE conversations SET updated_at = NEW.timestamp WHERE id = NEW.conversation_id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS trg_msg_touch ON messages",
+    """CREATE TRIGGER trg_msg_touch AFTER INSERT ON messages
+        FOR EACH ROW EXECUTE PROCEDURE touch_conversation()""",
+]
+
+# Typed with the messages columns so results are parsed like table selects
+SQLITE_FTS_SEARCH = sqlalchemy.text("""
+    SELECT m.* FROM messages_fts f JOIN messages m ON m.id = f.rowid
+    WHERE messages_fts MATCH :match ORDER BY rank LIMIT :limit
+""").columns(*messages.c)
+
+
+def _dump_metadata(metadata: Optional[Dict[str, Any]]) -> str:
+    """Serialize message metadata for the TEXT column"""
+    return orjson.dumps(metadata).decode() if metadata else "{}"
+
+
+def _load_metadata(raw: Optional[str]) -> Dict[str, Any]:
+    """Parse a stored metadata column; empty values skip the parser"""
+    if raw in (None, "", "{}"):
+        return {}
+    return orjson.loads(raw)
+
+
+def _message_from_row(row) -> ConversationMessage:
+    """Build a message from a messages row, unpacking its columns in table order"""
+    id, conversation_id, role, content, timestamp, raw_metadata = row._mapping
+    return ConversationMessage(
+        id, conversation_id, role, content, timestamp, _load_metadata(raw_metadata)
+    )
+
+
+# Statements built once at import; per-call values are bound by name
+_INSERT_MSG = messages.insert()
+# The id comes back from the INSERT itself (databases' execute() only reports
+# lastrowid on SQLite)
+_INSERT_MSG_RETURNING_ID = _INSERT_MSG.returning(messages.c.id)
+_SELECT_MSGS = messages.select().where(
+    messages.c.conversation_id == sqlalchemy.bindparam("cid")
+).order_by(messages.c.timestamp.asc(), messages.c.id.asc())
+# Message counts come from the same query via LEFT JOIN ... GROUP BY
+_LIST_CONVERSATIONS = sqlalchemy.select(
+    conversations,
+    sqlalchemy.func.count(messages.c.id).label("message_count")
+).select_from(
+    conversations.outerjoin(
+        messages, conversations.c.id == messages.c.conversation_id
+    )
+).group_by(
+    conversations.c.id
+).order_by(
+    conversations.c.updated_at.desc()
+).limit(sqlalchemy.bindparam("limit"))
+_SEARCH_MSGS = messages.select().where(
+    messages.c.content.ilike(sqlalchemy.bindparam("pattern"), escape="\\")
+).order_by(messages.c.timestamp.desc()).limit(sqlalchemy.bindparam("limit"))
+
+
 class MemoryManager:
     """Persistent memory storage (Async - SQLite/PostgreSQL)"""
     
     def __init__(self):
         self.database_url = config.database_url
         self.database = databases.Database(self.database_url)
+        self.is_sqlite = self.database.url.dialect == "sqlite"
+        # Executes queries: the Database itself, or a pinned connection for SQLite
+        self._db = self.database
+        # Serializes write transactions on the shared SQLite connection; other
+        # databases give each transaction its own pooled connection
+        self._write_lock = asyncio.Lock() if self.is_sqlite else contextlib.nullcontext()
+        self._upsert_conversation = self._insert_ignore(conversations)
+        # Whether the database fills in timestamps itself (set on connect)
+        self.server_timestamps = True
+        # Set on connect() when SQLite has FTS5 available
+        self.has_fts = False
         print(f"[Memory] Initialized with {self.database_url.split(':')[0]} database")
     
     async def connect(self):
@@ -72,21 +188,72 @@ class MemoryManager:
         # using sync SQLAlchemy engine for schema creation
         engine = sqlalchemy.create_engine(self.database_url)
         metadata.create_all(engine)
+        # create_all skips indexes added after their table was created
+        for index in messages.indexes:
+            index.create(engine, checkfirst=True)
+        # Tables created before timestamps had a server default still need them from Python
+        self.server_timestamps = any(
+            column["name"] == "timestamp" and column["default"]
+            for column in sqlalchemy.inspect(engine).get_columns("messages")
+        )
+        engine.dispose()
+        
+        if self.is_sqlite:
+            # databases opens a new SQLite connection for every query; keep one
+            # open for the process instead (its queries are serialized internally)
+            connection = self.database.connection()
+            await connection.__aenter__()
+            for pragma in SQLITE_PRAGMAS:
+                await connection.execute(pragma)
+            self._db = connection
+        
+        for statement in SQLITE_TRIGGERS if self.is_sqlite else POSTGRES_TRIGGERS:
+            await self._db.execute(statement)
+        if self.is_sqlite:
+            await self._create_fts()
         
     async def disconnect(self):
         """Disconnect from the database"""
+        if self._db is not self.database:
+            await self._db.__aexit__(None, None, None)
+            self._db = self.database
         await self.database.disconnect()
     
+    async def _create_fts(self):
+        """Create the SQLite full-text index, filling it on first creation"""
+        existing = await self._db.fetch_val(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )
+        try:
+            for statement in SQLITE_FTS_SCHEMA:
+                await self._db.execute(statement)
+            if existing is None:
+                await self._db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+            self.has_fts = True
+        except Exception as e:
+            print(f"[Memory] Full-text search unavailable, using LIKE: {e}")
+    
+    def _insert_ignore(self, table: sqlalchemy.Table):
+        """INSERT that skips rows whose primary key already exists"""
+        dialect = sqlite if self.is_sqlite else postgresql
+        return dialect.insert(table).on_conflict_do_nothing()
+    
+    def _timestamps(self, *columns: str) -> Dict[str, datetime]:
+        """Timestamp values to insert; empty when the database defaults them"""
+        if self.server_timestamps:
+            return {}
+        return dict.fromkeys(columns, datetime.utcnow())
+    
     async def create_conversation(self, conv_id: str, title: str = "") -> str:
         """Create a new conversation"""
         query = conversations.insert().values(
             id=conv_id,
             title=title,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            **self._timestamps("created_at", "updated_at")
         )
         try:
-            await self.database.execute(query)
+            async with self._write_lock:
+                await self._db.execute(query)
             return conv_id
         except Exception as e:
             # Ignore if exists (could be race condition or re-run)
@@ -101,113 +268,117 @@ class MemoryManager:
         metadata: Optional[Dict[str, Any]] = None
     ) -> int:
         """Add a message to a conversation"""
-        # Ensure conversation exists
-        await self.create_conversation(conversation_id)
-        
-        # Insert message
-        query = messages.insert().values(
-            conversation_id=conversation_id,
-            role=role,
-            content=content,
-            timestamp=datetime.utcnow(),
-            metadata=json.dumps(metadata or {})
-        )
-        message_id = await self.database.execute(query)
-        
-        # Update conversation timestamp
-        update_query = conversations.update().where(
-            conversations.c.id == conversation_id
-        ).values(updated_at=datetime.utcnow())
-        await self.database.execute(update_query)
+        # Ensure conversation exists and insert the message in a single
+        # transaction (one commit); trg_msg_touch updates updated_at
+        async with self._write_lock, self._db.transaction():
+            await self._db.execute(self._upsert_conversation, values={
+                "id": conversation_id,
+                "title": "",
+                **self._timestamps("created_at", "updated_at")
+            })
+            message_id = await self._db.fetch_val(_INSERT_MSG_RETURNING_ID, values={
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "metadata": _dump_metadata(metadata),
+                **self._timestamps("timestamp")
+            })
         
         return message_id
     
+    async def add_messages(
+        self,
+        conversation_id: str,
+        items: List[Tuple[str, str, Optional[Dict[str, Any]]]]
+    ):
+        """Add several (role, content, metadata) messages in one transaction"""
+        if not items:
+            return
+        stamps = self._timestamps("timestamp")
+        
+        async with self._write_lock, self._db.transaction():
+            await self._db.execute(self._upsert_conversation, values={
+                "id": conversation_id,
+                "title": "",
+                **self._timestamps("created_at", "updated_at")
+            })
+            await self._db.execute_many(_INSERT_MSG, values=[
+                {
+                    "conversation_id": conversation_id,
+                    "role": role,
+                    "content": content,
+                    "metadata": _dump_metadata(metadata),
+                    **stamps
+                }
+                for role, content, metadata in items
+            ])
+    
     async def get_messages(
         self,
         conversation_id: str,
         limit: Optional[int] = None
     ) -> List[ConversationMessage]:
         """Get messages from a conversation"""
-        query = messages.select().where(
-            messages.c.conversation_id == conversation_id
-        ).order_by(messages.c.timestamp.asc())
+        query = _SELECT_MSGS.params(cid=conversation_id)
         
         if limit:
             query = query.limit(limit)
             
-        rows = await self.database.fetch_all(query)
+        rows = await self._db.fetch_all(query)
         
-        return [
-            ConversationMessage(
-                id=row["id"],
-                conversation_id=row["conversation_id"],
-                role=row["role"],
-                content=row["content"],
-                timestamp=row["timestamp"],
-                metadata=json.loads(row["metadata"]) if row["metadata"] else {}
-            )
-            for row in rows
-        ]
+        return [_message_from_row(row) for row in rows]
     
     async def list_conversations(self, limit: int = 50) -> List[Conversation]:
         """List all conversations"""
-        # Simple list without join to be safer across DBs initially
-        query = conversations.select().order_by(
-            conversations.c.updated_at.desc()
-        ).limit(limit)
-        
-        rows = await self.database.fetch_all(query)
+        rows = await self._db.fetch_all(_LIST_CONVERSATIONS.params(limit=limit))
         
-        result = []
-        for row in rows:
-            # Get message count separately
-            count_query = sqlalchemy.select([sqlalchemy.func.count()]).select_from(messages).where(
-                messages.c.conversation_id == row["id"]
-            )
-            count = await self.database.fetch_val(count_query)
-            
-            result.append(Conversation(
+        return [
+            Conversation(
                 id=row["id"],
                 title=row["title"],
                 created_at=row["created_at"],
                 updated_at=row["updated_at"],
-                message_count=count or 0
-            ))
-        return result
+                message_count=row["message_count"] or 0
+            )
+            for row in rows
+        ]
     
     async def delete_conversation(self, conversation_id: str):
         """Delete a conversation"""
-        # Delete messages first
-        await self.database.execute(
-            messages.delete().where(messages.c.conversation_id == conversation_id)
-        )
-        # Delete conversation
-        await self.database.execute(
-            conversations.delete().where(conversations.c.id == conversation_id)
-        )
+        async with self._write_lock, self._db.transaction():
+            # Delete messages first
+            await self._db.execute(
+                messages.delete().where(messages.c.conversation_id == conversation_id)
+            )
+            # Delete conversation
+            await self._db.execute(
+                conversations.delete().where(conversations.c.id == conversation_id)
+            )
     
     async def search_messages(self, query_text: str, limit: int = 20) -> List[ConversationMessage]:
         """Search messages by content"""
-        # Use simple LIKE query
-        query = messages.select().where(
-            messages.c.content.ilike(f"%{query_text}%")
-        ).order_by(messages.c.timestamp.desc()).limit(limit)
-        
-        rows = await self.database.fetch_all(query)
-        
-        return [
-            ConversationMessage(
-                id=row["id"],
-                conversation_id=row["conversation_id"],
-                role=row["role"],
-                content=row["content"],
-                timestamp=row["timestamp"],
-                metadata=json.loads(row["metadata"]) if row["metadata"] else {}
+        terms = query_text.split()
+        if self.has_fts and terms:
+            # Quote each term so FTS5 operators in user input are matched literally,
+            # and prefix-match it to stay close to the substring search
+            match = " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+            rows = await self._db.fetch_all(
+                SQLITE_FTS_SEARCH.params(match=match, limit=limit)
             )
-            for row in rows
-        ]
+        else:
+            # LIKE wildcards typed by the user are matched literally
+            pattern = query_text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            rows = await self._db.fetch_all(
+                _SEARCH_MSGS.params(pattern=f"%{pattern}%", limit=limit)
+            )
+        
+        return [_message_from_row(row) for row in rows]
 
 
-# Global memory instance
-memory = MemoryManager()
+# Global memory instance, created on first access rather than at import
+def __getattr__(name):
+    if name == "memory":
+        globals()["memory"] = MemoryManager()
+        return globals()["memory"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -1,21 +1,31 @@
 # Antigravity Ultra - Multi-Model Orchestration
 import asyncio
+import logging
+import random
+import time
 import httpx
-from typing import AsyncGenerator, Optional, Dict, Any, List
+from collections import OrderedDict
+from contextlib import aclosing
+from hashlib import blake2b
+from typing import AsyncGenerator, Awaitable, Callable, Optional, Dict, Any, List, Literal, Tuple, Union
 from dataclasses import dataclass
-import json
+import orjson
 
-from config import config, MODELS
+from config import config, MODELS_BY_PROVIDER
 from huggingface_client import HuggingFaceClient
+from streaming import iter_lines, iter_sse
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class ChatMessage:
     role: str  # "user", "assistant", "system"
     content: str
+    cache: bool = False  # Stable prefix the provider may cache across requests
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ModelResponse:
     content: str
     model: str
@@ -23,54 +33,180 @@ class ModelResponse:
     finish_reason: str
 
 
+# "fallback" tries providers one after another, "hedge" starts Ollama once Groq
+# has had config.hedge_delay_s to answer, "first_success" starts both at once
+Strategy = Literal["fallback", "hedge", "first_success"]
+
+
+def _encode(messages: List[ChatMessage]) -> bytes:
+    """Encode messages as the role/content JSON array both chat APIs expect"""
+    return orjson.dumps([{"role": m.role, "content": m.content} for m in messages])
+
+
+def _serialize(messages: List[ChatMessage]) -> orjson.Fragment:
+    """Wrap the encoded messages for embedding in request bodies"""
+    # A fragment is copied as-is into each request body that embeds it, so
+    # the history is encoded once however many providers are tried
+    return orjson.Fragment(_encode(messages))
+
+
+async def _coalesce(chunks: AsyncGenerator[str, None], ms: float) -> AsyncGenerator[str, None]:
+    """Join the chunks that arrive within `ms` of the previous yield into one"""
+    loop = asyncio.get_running_loop()
+    interval = ms / 1000
+    buffer: List[str] = []
+    # The first chunk goes out at once, later ones at most every interval
+    flushed_at = float("-inf")
+    # Kept across flushes: cancelling a pending __anext__ would end the stream
+    pending = asyncio.ensure_future(chunks.__anext__())
+    try:
+        while True:
+            if buffer:
+                remaining = flushed_at + interval - loop.time()
+                if remaining <= 0 or not (await asyncio.wait({pending}, timeout=remaining))[0]:
+                    yield "".join(buffer)
+                    buffer.clear()
+                    flushed_at = loop.time()
+                    continue
+            try:
+                buffer.append(await pending)
+            except StopAsyncIteration:
+                break
+            except Exception:
+                # Text already received still reaches the caller before the error
+                if buffer:
+                    yield "".join(buffer)
+                raise
+            pending = asyncio.ensure_future(chunks.__anext__())
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # Settles the pending read (retrieving any error) before closing the source
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await chunks.aclose()
+
+
+# HTTP client shared by every GroqClient that isn't given its own, so they all
+# reuse the same pooled connections. Created on first request.
+_shared_groq_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_groq_client() -> httpx.AsyncClient:
+    """Return the shared Groq HTTP client, creating it if needed"""
+    global _shared_groq_client
+    if _shared_groq_client is None or _shared_groq_client.is_closed:
+        # Concurrent requests multiplex over one HTTP/2 connection; the
+        # transport retries failed connection attempts
+        _shared_groq_client = httpx.AsyncClient(
+            base_url=GroqClient.BASE_URL,
+            headers={"Content-Type": "application/json"},
+            timeout=60.0,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=30
+                ),
+                retries=2
+            )
+        )
+    return _shared_groq_client
+
+
+async def close_groq_client():
+    """Close the shared Groq HTTP client"""
+    global _shared_groq_client
+    if _shared_groq_client is not None:
+        await _shared_groq_client.aclose()
+        _shared_groq_client = None
+
+
 class GroqClient:
     """Client for Groq API (FREE & ultra-fast)"""
     
     BASE_URL = "https://api.groq.com/openai/v1"
     
-    def __init__(self, api_key: Optional[str] = None):
+    # Rate limits and server errors are usually gone within a second, so they
+    # are retried with jittered exponential backoff before falling back
+    MAX_ATTEMPTS = 4
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+    BACKOFF_BASE = 0.25
+    BACKOFF_MAX = 8.0
+    
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None
+    ):
         self.api_key = api_key or config.groq_api_key
         self._available = self.api_key is not None and len(self.api_key) > 0
+        # An injected client stays owned by the caller; without one the
+        # shared client is used
+        self._client = client
+        # Sent per request so clients with different keys can share connections
+        self._headers = {"Authorization": f"Bearer {self.api_key}"} if self._available else {}
         
         if self._available:
-            self.client = httpx.AsyncClient(
-                base_url=self.BASE_URL,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                timeout=60.0
-            )
             print(f"[Groq] API key found, Groq client initialized")
         else:
-            self.client = None
             print(f"[Groq] No API key found (GROQ_API_KEY not set)")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or _get_groq_client()
+    
     def is_available(self) -> bool:
         """Check if Groq API key is configured"""
         return self._available
     
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, None if the server asks for too long a wait"""
+        try:
+            delay = float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt) + random.random() * 0.1
+        # Falling back to another provider beats a long wait
+        return delay if delay <= self.BACKOFF_MAX else None
+    
+    async def _send(self, body: bytes, stream: bool = False) -> httpx.Response:
+        """POST a completion request, retrying rate limits and server errors"""
+        for attempt in range(self.MAX_ATTEMPTS):
+            request = self.client.build_request(
+                "POST",
+                "/chat/completions",
+                headers=self._headers,
+                content=body
+            )
+            response = await self.client.send(request, stream=stream)
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.MAX_ATTEMPTS - 1:
+                return response
+            delay = self._retry_delay(response, attempt)
+            if delay is None:
+                return response
+            await response.aclose()
+            await asyncio.sleep(delay)
+    
     async def chat(
         self,
         messages: List[ChatMessage],
         model: str = "llama-3.1-70b-versatile",
         temperature: float = 0.7,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        serialized: Optional[orjson.Fragment] = None
     ) -> ModelResponse:
         """Send a chat completion request"""
         if not self._available:
             raise RuntimeError("Groq API key not configured")
-        response = await self.client.post(
-            "/chat/completions",
-            json={
-                "model": model,
-                "messages": [{"role": m.role, "content": m.content} for m in messages],
-                "temperature": temperature,
-                "max_tokens": max_tokens
-            }
-        )
+        response = await self._send(orjson.dumps({
+            "model": model,
+            "messages": serialized if serialized is not None else _serialize(messages),
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }))
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         return ModelResponse(
             content=data["choices"][0]["message"]["content"],
@@ -84,37 +220,35 @@ class GroqClient:
         messages: List[ChatMessage],
         model: str = "llama-3.1-70b-versatile",
         temperature: float = 0.7,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        serialized: Optional[orjson.Fragment] = None
     ) -> AsyncGenerator[str, None]:
         """Stream a chat completion"""
         if not self._available:
             raise RuntimeError("Groq API key not configured")
-        async with self.client.stream(
-            "POST",
-            "/chat/completions",
-            json={
-                "model": model,
-                "messages": [{"role": m.role, "content": m.content} for m in messages],
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-                "stream": True
-            }
-        ) as response:
+        # Only opening the stream is retried; a failure mid-answer reaches the caller
+        response = await self._send(orjson.dumps({
+            "model": model,
+            "messages": serialized if serialized is not None else _serialize(messages),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }), stream=True)
+        try:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    data = line[6:]
-                    if data == "[DONE]":
-                        break
+            async with aclosing(iter_sse(response)) as events:
+                async for data in events:
                     try:
-                        chunk = json.loads(data)
+                        chunk = orjson.loads(data)
                         if chunk["choices"][0]["delta"].get("content"):
                             yield chunk["choices"][0]["delta"]["content"]
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         continue
+        finally:
+            await response.aclose()
     
     async def close(self):
-        await self.client.aclose()
+        """Nothing to close: the client is either the caller's or shared"""
 
 
 class OllamaClient:
@@ -122,50 +256,96 @@ class OllamaClient:
     
     BASE_URL = "http://localhost:11434"
     
+    # Seconds an availability check is trusted, so a restarted Ollama is noticed
+    AVAILABILITY_TTL = 30
+    
     def __init__(self):
+        # Localhost: every connection may stay open, and for long, since a
+        # reconnect is pure overhead; one retry covers a restarting server
         self.client = httpx.AsyncClient(
             base_url=self.BASE_URL,
-            timeout=120.0
+            headers={"Content-Type": "application/json"},
+            timeout=httpx.Timeout(connect=2.0, read=120.0, write=10.0, pool=5.0),
+            transport=httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=32,
+                    max_keepalive_connections=32,
+                    keepalive_expiry=120
+                ),
+                retries=1
+            )
         )
-        self._available = None
+        # (time.monotonic() of the last check, its result)
+        self._available: Tuple[float, bool] = (float("-inf"), False)
+        self._probe: Optional[asyncio.Task] = None
     
-    async def is_available(self) -> bool:
-        """Check if Ollama is running"""
-        if self._available is not None:
-            return self._available
+    async def _check(self) -> bool:
+        """Ask the server whether it is up and record the answer"""
         try:
             response = await self.client.get("/api/tags")
-            self._available = response.status_code == 200
+            available = response.status_code == 200
         except Exception:
-            self._available = False
-        return self._available
+            available = False
+        self._available = (time.monotonic(), available)
+        return available
+    
+    async def is_available(self) -> bool:
+        """Check if Ollama is running, reusing a recent answer"""
+        checked_at, available = self._available
+        if time.monotonic() - checked_at < self.AVAILABILITY_TTL:
+            return available
+        # Concurrent callers share one request; shielded so a cancelled caller doesn't cancel it
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.create_task(self._check())
+        return await asyncio.shield(self._probe)
     
     async def list_models(self) -> List[str]:
-        """List available Ollama models"""
-        if not await self.is_available():
+        """List available Ollama models, empty if Ollama isn't running"""
+        # The same request answers is_available(), so record it
+        try:
+            response = await self.client.get("/api/tags")
+            response.raise_for_status()
+        except httpx.HTTPError:
+            self._available = (time.monotonic(), False)
             return []
-        response = await self.client.get("/api/tags")
-        data = response.json()
+        self._available = (time.monotonic(), True)
+        data = orjson.loads(response.content)
         return [m["name"] for m in data.get("models", [])]
     
+    def _payload(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: float,
+        stream: bool,
+        serialized: Optional[orjson.Fragment] = None
+    ) -> Dict[str, Any]:
+        """Build an /api/chat request body"""
+        payload = {
+            "model": model,
+            "messages": serialized if serialized is not None else _serialize(messages),
+            "stream": stream,
+            "options": {"temperature": temperature}
+        }
+        if messages and messages[0].cache:
+            # Keep the model loaded so Ollama can reuse its KV cache for the prefix
+            payload["keep_alive"] = config.ollama_keep_alive
+        return payload
+    
     async def chat(
         self,
         messages: List[ChatMessage],
         model: str = "llama3.1",
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        serialized: Optional[orjson.Fragment] = None
     ) -> ModelResponse:
         """Send a chat request to Ollama"""
         response = await self.client.post(
             "/api/chat",
-            json={
-                "model": model,
-                "messages": [{"role": m.role, "content": m.content} for m in messages],
-                "stream": False,
-                "options": {"temperature": temperature}
-            }
+            content=orjson.dumps(self._payload(messages, model, temperature, False, serialized))
         )
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         
         return ModelResponse(
             content=data["message"]["content"],
@@ -178,30 +358,27 @@ class OllamaClient:
         self,
         messages: List[ChatMessage],
         model: str = "llama3.1",
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        serialized: Optional[orjson.Fragment] = None
     ) -> AsyncGenerator[str, None]:
         """Stream a chat response from Ollama"""
         async with self.client.stream(
             "POST",
             "/api/chat",
-            json={
-                "model": model,
-                "messages": [{"role": m.role, "content": m.content} for m in messages],
-                "stream": True,
-                "options": {"temperature": temperature}
-            }
+            content=orjson.dumps(self._payload(messages, model, temperature, True, serialized))
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line:
-                    try:
-                        data = json.loads(line)
-                        if data.get("message", {}).get("content"):
-                            yield data["message"]["content"]
-                        if data.get("done"):
-                            break
-                    except json.JSONDecodeError:
-                        continue
+            async with aclosing(iter_lines(response)) as lines:
+                async for line in lines:
+                    if line:
+                        try:
+                            data = orjson.loads(line)
+                            if data.get("message", {}).get("content"):
+                                yield data["message"]["content"]
+                            if data.get("done"):
+                                break
+                        except orjson.JSONDecodeError:
+                            continue
     
     async def close(self):
         await self.client.aclose()
@@ -210,48 +387,215 @@ class OllamaClient:
 class ModelOrchestrator:
     """Orchestrates multiple LLM providers with fallback"""
     
+    # Answers kept for repeated requests, and the highest temperature still
+    # deterministic enough for an identical request to reuse one
+    CACHE_SIZE = 512
+    CACHE_MAX_TEMPERATURE = 0.1
+    
     def __init__(self):
         self.groq = GroqClient()
         self.ollama = OllamaClient()
         self.huggingface = HuggingFaceClient(api_key=config.huggingface_api_key)  # FREE fallback/Paid with key
-        self._ollama_available = None
+        self._warm_task: Optional[asyncio.Task] = None
+        self._responses: "OrderedDict[Tuple[str, float, int, str, bytes], ModelResponse]" = OrderedDict()
+        # Groq model id -> bound call, so routing a request is one dict lookup;
+        # empty without an API key, as Groq can't become available later
+        groq_models = MODELS_BY_PROVIDER["groq"] if self.groq.is_available() else ()
+        self._chat_fns: Dict[str, Callable[..., Awaitable[ModelResponse]]] = dict.fromkeys(groq_models, self.groq.chat)
+        self._stream_fns: Dict[str, Callable[..., AsyncGenerator[str, None]]] = dict.fromkeys(groq_models, self.groq.chat_stream)
         print(f"[Orchestrator] Initialized - Groq: {self.groq.is_available()}, HuggingFace: {self.huggingface.is_available()}")
     
+    async def warmup(self):
+        """Resolve provider availability before the first request"""
+        await self.ollama.is_available()
+    
+    def _ensure_warm(self):
+        """Check Ollama in the background on first use, while Groq is being tried"""
+        if self._warm_task is None:
+            self._warm_task = asyncio.create_task(self.ollama.is_available())
+    
+    async def _groq_models(self) -> List[str]:
+        """Groq models from the catalog"""
+        return list(MODELS_BY_PROVIDER["groq"])
+    
+    async def _ollama_models(self) -> List[str]:
+        """Models pulled into the local Ollama, empty if it can't be reached"""
+        return await self.ollama.list_models()
+    
     async def get_available_models(self) -> Dict[str, List[str]]:
         """Get all available models by provider"""
-        models = {
-            "groq": list(k for k, v in MODELS.items() if v.provider == "groq")
-        }
+        # Providers are asked concurrently; one failing doesn't hide the others
+        results = await asyncio.gather(
+            self._groq_models(),
+            self._ollama_models(),
+            return_exceptions=True
+        )
         
-        if await self.ollama.is_available():
-            models["ollama"] = await self.ollama.list_models()
+        models = {}
+        for provider, result in zip(("groq", "ollama"), results):
+            if isinstance(result, Exception):
+                logger.warning("Could not list %s models: %s", provider, result)
+            elif result:
+                models[provider] = result
         
         return models
     
+    async def _chat_hedged(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        delay: float,
+        serialized: Optional[orjson.Fragment] = None
+    ) -> Optional[ModelResponse]:
+        """Race Groq and Ollama, each starting `delay` seconds after the previous one"""
+        if serialized is None:
+            serialized = _serialize(messages)
+        ollama_model = model.replace("ollama/", "") if model.startswith("ollama/") else "llama3.1"
+        # Checked while Groq is already running rather than before it starts
+        ollama_up = asyncio.create_task(self.ollama.is_available())
+        
+        async def ollama_chat() -> Optional[ModelResponse]:
+            if not await ollama_up:
+                return None
+            return await self.ollama.chat(messages, ollama_model, temperature, serialized)
+        
+        queue = []
+        if (chat_fn := self._chat_fns.get(model)) is not None:
+            queue.append(("Groq", lambda: chat_fn(messages, model, temperature, max_tokens, serialized)))
+        queue.append(("Ollama", ollama_chat))
+        
+        running: Dict[asyncio.Task, str] = {}
+        try:
+            while queue or running:
+                # The next provider starts when the delay runs out or every running one failed
+                if queue and not running:
+                    name, start = queue.pop(0)
+                    running[asyncio.create_task(start())] = name
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=delay if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    name, start = queue.pop(0)
+                    running[asyncio.create_task(start())] = name
+                    continue
+                # Every finished task is looked at, so no failure goes unretrieved
+                response = None
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning("%s error: %s, waiting for the other providers", name, e)
+                    else:
+                        response = response or result
+                if response is not None:
+                    return response
+        finally:
+            # The slower provider's answer is no longer needed
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        return None
+    
     async def chat(
         self,
         messages: List[ChatMessage],
         model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        strategy: Strategy = "fallback",
+        use_cache: bool = True
     ) -> ModelResponse:
         """Send a chat request to the best available model"""
         model = model or config.default_model
+        if not use_cache or temperature > self.CACHE_MAX_TEMPERATURE:
+            return await self._chat(messages, model, temperature, max_tokens, strategy)
+        
+        # Least recently used answers are evicted first. The history is encoded
+        # once: the same bytes key the cache and go into the request bodies
+        encoded = _encode(messages)
+        digest = blake2b(encoded, digest_size=16).digest()
+        key = (model, temperature, max_tokens, strategy, digest)
+        cached = self._responses.get(key)
+        if cached is not None:
+            self._responses.move_to_end(key)
+            return cached
+        
+        response = await self._chat(
+            messages, model, temperature, max_tokens, strategy, orjson.Fragment(encoded)
+        )
+        # A fallback answer would keep being served after the requested model recovers
+        if response.model not in (model, model.removeprefix("ollama/")):
+            return response
+        self._responses[key] = response
+        if len(self._responses) > self.CACHE_SIZE:
+            self._responses.popitem(last=False)
+        return response
+    
+    async def chat_batch(
+        self,
+        batches: List[List[ChatMessage]],
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096,
+        concurrency: int = 8
+    ) -> List[Union[ModelResponse, BaseException]]:
+        """Run independent chat requests concurrently, at most `concurrency` at a time"""
+        # Results keep the order of `batches`; a failed request yields its exception
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def one(messages: List[ChatMessage]) -> ModelResponse:
+            async with semaphore:
+                return await self.chat(messages, model, temperature, max_tokens)
+        
+        return await asyncio.gather(*(one(messages) for messages in batches), return_exceptions=True)
+    
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        strategy: Strategy,
+        serialized: Optional[orjson.Fragment] = None
+    ) -> ModelResponse:
+        """Ask the providers in the order the strategy picks"""
+        self._ensure_warm()
+        # Serialized at most once, unless the caller already did, and shared
+        # by the Groq and Ollama attempts
+        hedged = strategy != "fallback"
+        
+        if hedged:
+            if strategy not in ("hedge", "first_success"):
+                raise ValueError(f"Unknown strategy: {strategy}")
+            delay = config.hedge_delay_s if strategy == "hedge" else 0.0
+            response = await self._chat_hedged(messages, model, temperature, max_tokens, delay, serialized)
+            if response is not None:
+                return response
         
         # Try Groq first (if API key configured)
-        if self.groq.is_available() and model in MODELS and MODELS[model].provider == "groq":
+        chat_fn = None if hedged else self._chat_fns.get(model)
+        if chat_fn is not None:
+            if serialized is None:
+                serialized = _serialize(messages)
             try:
-                return await self.groq.chat(messages, model, temperature, max_tokens)
+                return await chat_fn(messages, model, temperature, max_tokens, serialized)
             except Exception as e:
-                print(f"Groq error: {e}, trying fallback...")
+                logger.warning("Groq error: %s, trying fallback", e)
         
         # Try Ollama as fallback
-        if await self.ollama.is_available():
+        if not hedged and await self.ollama.is_available():
             ollama_model = model.replace("ollama/", "") if model.startswith("ollama/") else "llama3.1"
+            if serialized is None:
+                serialized = _serialize(messages)
             try:
-                return await self.ollama.chat(messages, ollama_model, temperature)
+                return await self.ollama.chat(messages, ollama_model, temperature, serialized)
             except Exception as e:
-                print(f"Ollama error: {e}, trying HuggingFace...")
+                logger.warning("Ollama error: %s, trying HuggingFace", e)
         
         # Try HuggingFace (FREE fallback - always available)
         if self.huggingface.is_available():
@@ -259,7 +603,7 @@ class ModelOrchestrator:
             try:
                 return await self.huggingface.chat(messages)
             except Exception as e:
-                print(f"HuggingFace error: {e}")
+                logger.warning("HuggingFace error: %s", e)
         
         raise RuntimeError("No LLM provider available")
     
@@ -268,47 +612,100 @@ class ModelOrchestrator:
         messages: List[ChatMessage],
         model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 4096
+        max_tokens: int = 4096,
+        yield_every_ms: float = 16
     ) -> AsyncGenerator[str, None]:
         """Stream a chat response from the best available model"""
-        model = model or config.default_model
+        # Tokens often arrive a few characters at a time; grouping them into
+        # ~60 updates per second spares consumers a wakeup and render per token
+        chunks = self._stream(messages, model or config.default_model, temperature, max_tokens)
+        if yield_every_ms > 0:
+            chunks = _coalesce(chunks, yield_every_ms)
+        # Closed as soon as the consumer stops, not when garbage collected
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                yield chunk
+    
+    async def _stream(
+        self,
+        messages: List[ChatMessage],
+        model: str,
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncGenerator[str, None]:
+        """Stream from the first provider that answers"""
+        self._ensure_warm()
+        # Serialized at most once, shared by the Groq and Ollama attempts
+        serialized = None
         
         # Try Groq first (if API key configured)
-        if self.groq.is_available() and model in MODELS and MODELS[model].provider == "groq":
+        stream_fn = self._stream_fns.get(model)
+        if stream_fn is not None:
+            serialized = _serialize(messages)
             try:
-                async for chunk in self.groq.chat_stream(messages, model, temperature, max_tokens):
-                    yield chunk
+                async with aclosing(stream_fn(messages, model, temperature, max_tokens, serialized)) as chunks:
+                    async for chunk in chunks:
+                        yield chunk
                 return
             except Exception as e:
-                print(f"Groq stream error: {e}, trying fallback...")
+                logger.warning("Groq stream error: %s, trying fallback", e)
         
         # Try Ollama
         if await self.ollama.is_available():
             ollama_model = model.replace("ollama/", "") if model.startswith("ollama/") else "llama3.1"
+            if serialized is None:
+                serialized = _serialize(messages)
             try:
-                async for chunk in self.ollama.chat_stream(messages, ollama_model, temperature):
-                    yield chunk
+                async with aclosing(self.ollama.chat_stream(messages, ollama_model, temperature, serialized)) as chunks:
+                    async for chunk in chunks:
+                        yield chunk
                 return
             except Exception as e:
-                print(f"Ollama stream error: {e}, trying HuggingFace...")
+                logger.warning("Ollama stream error: %s, trying HuggingFace", e)
         
         # Try HuggingFace (FREE fallback - always available)
         if self.huggingface.is_available():
             print("[Orchestrator] Using HuggingFace free inference...")
             try:
-                async for chunk in self.huggingface.chat_stream(messages):
-                    yield chunk
+                async with aclosing(self.huggingface.chat_stream(messages)) as chunks:
+                    async for chunk in chunks:
+                        yield chunk
                 return
             except Exception as e:
-                print(f"HuggingFace stream error: {e}")
+                logger.warning("HuggingFace stream error: %s", e)
         
         raise RuntimeError("No LLM provider available for streaming")
     
     async def close(self):
         await self.groq.close()
+        await close_groq_client()
         await self.ollama.close()
         await self.huggingface.close()
 
 
-# Global orchestrator instance
-orchestrator = ModelOrchestrator()
+# Shared orchestrator, created on first use inside the running event loop
+# rather than at import
+_orchestrator: Optional[ModelOrchestrator] = None
+
+
+def get_orchestrator() -> ModelOrchestrator:
+    """Return the shared orchestrator, creating it if needed"""
+    global _orchestrator
+    if _orchestrator is None:
+        _orchestrator = ModelOrchestrator()
+    return _orchestrator
+
+
+async def close_orchestrator():
+    """Close the shared orchestrator and its HTTP clients"""
+    global _orchestrator
+    if _orchestrator is not None:
+        await _orchestrator.close()
+        _orchestrator = None
+
+
+# `from models import orchestrator` keeps working, resolved on first access
+def __getattr__(name):
+    if name == "orchestrator":
+        return get_orchestrator()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
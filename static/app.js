@@ -56,12 +56,20 @@ class AntigravityUltra {
                 this.appendToCurrentMessage(data.content);
                 break;
 
+            case 'chunks':
+                this.appendToCurrentMessage(data.contents.join(''));
+                break;
+
             case 'tool_call':
-                this.showToolCall(data.name, data.arguments);
+                this.showToolCall(data.name, data.arguments, data.index);
+                break;
+
+            case 'tool_output':
+                this.appendToolOutput(data.content, data.index);
                 break;
 
             case 'tool_result':
-                this.showToolResult(data.name, data.result);
+                this.showToolResult(data.name, data.result, data.index);
                 break;
 
             case 'status':
@@ -182,11 +190,12 @@ class AntigravityUltra {
         this.scrollToBottom();
     }
 
-    showToolCall(name, args) {
+    showToolCall(name, args, index) {
         if (!this.currentMessageEl) return;
 
         const toolEl = document.createElement('div');
         toolEl.className = 'tool-call';
+        if (index !== undefined) toolEl.dataset.toolIndex = index;
         toolEl.innerHTML = `
             <div class="tool-call-header">
                 <span class="tool-call-icon">🔧</span>
@@ -201,12 +210,36 @@ class AntigravityUltra {
         this.scrollToBottom();
     }
 
-    showToolResult(name, result) {
-        // Find the last tool call and update it
+    appendToolOutput(content, index) {
+        // Stream live output into the tool call that produced it
+        const toolEl = this.findToolCall(index);
+        if (toolEl) {
+            let outputEl = toolEl.querySelector('.tool-output');
+            if (!outputEl) {
+                outputEl = document.createElement('div');
+                outputEl.className = 'tool-result tool-output';
+                toolEl.appendChild(outputEl);
+            }
+            outputEl.textContent += content;
+        }
+        this.scrollToBottom();
+    }
+
+    findToolCall(index) {
+        // The tool call box with this index, or the last one for events without an index
+        if (!this.currentMessageEl) return null;
+        if (index !== undefined) {
+            return this.currentMessageEl.querySelector(`.tool-call[data-tool-index="${index}"]`);
+        }
         const toolCalls = this.currentMessageEl.querySelectorAll('.tool-call');
-        if (toolCalls.length > 0) {
-            const lastTool = toolCalls[toolCalls.length - 1];
-            const resultEl = lastTool.querySelector('.tool-result');
+        return toolCalls.length > 0 ? toolCalls[toolCalls.length - 1] : null;
+    }
+
+    showToolResult(name, result, index) {
+        // Update the box of the call this result belongs to
+        const toolEl = this.findToolCall(index);
+        if (toolEl) {
+            const resultEl = toolEl.querySelector('.tool-result');
             if (resultEl) {
                 resultEl.textContent = result;
             }
@@ -0,0 +1,57 @@
+# Antigravity Ultra - Streamed Response Parsing
+import asyncio
+from contextlib import aclosing
+from typing import AsyncGenerator
+
+import httpx
+
+
+async def iter_lines(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+    """Yield the raw lines of a streamed response, without decoding them"""
+    # The network is read in its own task, so the next bytes arrive while the
+    # consumer is still parsing; the bounded queue stops it from running ahead
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+    
+    async def produce():
+        try:
+            # No chunk_size: a fixed size would hold tokens back until it fills up
+            async for chunk in response.aiter_bytes():
+                await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+    
+    # Callers close this generator (contextlib.aclosing) so the task never outlives it
+    producer = asyncio.create_task(produce())
+    buffer = bytearray()
+    try:
+        while (chunk := await queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            buffer.extend(chunk)
+            start = 0
+            while (end := buffer.find(b"\n", start)) != -1:
+                yield bytes(buffer[start:end]).rstrip(b"\r")
+                start = end + 1
+            del buffer[:start]
+        if buffer:
+            yield bytes(buffer)
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.wait({producer})
+
+
+async def iter_sse(response: httpx.Response) -> AsyncGenerator[bytes, None]:
+    """Yield the payload of each server-sent "data:" event until [DONE]"""
+    async with aclosing(iter_lines(response)) as lines:
+        async for line in lines:
+            # Prefix checks stay on bytes: keepalive comments and blank lines
+            # are skipped without ever being decoded
+            if line.startswith(b"data:"):
+                # The space after the colon is optional (OpenAI sends it, TGI doesn't)
+                data = line[6:] if line.startswith(b"data: ") else line[5:]
+                if data == b"[DONE]":
+                    return
+                yield data
@@ -0,0 +1,39 @@
+# Antigravity Ultra - Tests: Agent
+import asyncio
+
+import orjson
+
+from agent import Agent
+
+
+class _FakeOrchestrator:
+    """Streams a fixed reply"""
+    
+    def __init__(self, reply: str):
+        self.reply = reply
+    
+    async def chat_stream(self, messages, model=None):
+        yield self.reply
+
+
+def test_closing_turn_stops_running_tools(tmp_path, monkeypatch):
+    """Closing the turn mid-tool kills the tool's process"""
+    marker = tmp_path / "marker"
+    block = orjson.dumps({
+        "name": "execute_shell",
+        "arguments": {"command": f"echo started; sleep 1; touch {marker}"}
+    }).decode()
+    monkeypatch.setattr(Agent, "orchestrator", property(lambda self: _FakeOrchestrator(f"```tool\n{block}\n```")))
+    
+    async def main():
+        agent = Agent()
+        turn = agent.chat("hi")
+        async for event in turn:
+            if event["type"] == "tool_output":
+                break
+        await turn.aclose()
+        await asyncio.sleep(1.5)
+        await agent.close()
+    
+    asyncio.run(main())
+    assert not marker.exists()
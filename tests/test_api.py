@@ -0,0 +1,51 @@
+# Antigravity Ultra - Tests: API
+import orjson
+from fastapi.testclient import TestClient
+
+import api
+
+
+async def _noop(*args, **kwargs):
+    pass
+
+
+def _run_turn(monkeypatch, events):
+    """Send one message over the WebSocket and collect frames until done"""
+    async def chat(message, model=None):
+        for event in events:
+            yield event
+    
+    monkeypatch.setattr(api.agent, "chat", chat)
+    monkeypatch.setattr(api.memory, "add_message", _noop)
+    
+    frames = []
+    with TestClient(api.app).websocket_connect("/ws/chat") as websocket:
+        websocket.send_text(orjson.dumps({"message": "hi"}).decode())
+        while True:
+            frame = orjson.loads(websocket.receive_text())
+            if frame["type"] == "done":
+                return frames
+            frames.append(frame)
+
+
+def test_tool_frames_carry_index(monkeypatch):
+    """Tool call and result frames keep the index the UI routes them by"""
+    frames = _run_turn(monkeypatch, [
+        {"type": "tool_call", "name": "web_search", "arguments": {}, "index": 0},
+        {"type": "tool_call", "name": "web_search", "arguments": {}, "index": 1},
+        {"type": "tool_result", "name": "web_search", "result": "first", "index": 0},
+        {"type": "tool_result", "name": "web_search", "result": "second", "index": 1},
+    ])
+    calls = [f for f in frames if f["type"] == "tool_call"]
+    results = [f for f in frames if f["type"] == "tool_result"]
+    assert [f["index"] for f in calls] == [0, 1]
+    assert [(f["index"], f["result"]) for f in results] == [(0, "first"), (1, "second")]
+
+
+def test_tool_output_frames_carry_index(monkeypatch):
+    """Live output of concurrent tools keeps the index of its tool call"""
+    frames = _run_turn(monkeypatch, [
+        {"type": "tool_output", "name": "execute_shell", "stream": "stdout", "content": "a", "index": 0},
+        {"type": "tool_output", "name": "execute_shell", "stream": "stdout", "content": "b", "index": 1},
+    ])
+    assert [(f["index"], f["content"]) for f in frames if f["type"] == "tool_output"] == [(0, "a"), (1, "b")]
@@ -0,0 +1,32 @@
+# Antigravity Ultra - Tests: Code Executor
+import asyncio
+import time
+
+from agent.tools.code_executor import CodeExecutor
+
+
+def test_shell_timeout_kills_long_command():
+    """A shell command past the timeout is stopped at the deadline"""
+    executor = CodeExecutor(timeout=1)
+    started = time.monotonic()
+    result = asyncio.run(executor.execute_shell("sleep 10"))
+    assert time.monotonic() - started < 5
+    assert not result.success
+    assert "timed out" in result.error
+
+
+def test_shell_timeout_with_closed_fds():
+    """A command that closes its output pipes still times out"""
+    executor = CodeExecutor(timeout=1)
+    started = time.monotonic()
+    result = asyncio.run(executor.execute_shell("exec >/dev/null 2>&1; sleep 8"))
+    assert time.monotonic() - started < 5
+    assert not result.success
+    assert "timed out" in result.error
+
+
+def test_shell_output():
+    """A finished command reports its output and exit code"""
+    result = asyncio.run(CodeExecutor(timeout=5).execute_shell("echo hi; exit 3"))
+    assert result.output == "hi\n"
+    assert result.return_code == 3
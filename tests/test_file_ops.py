@@ -0,0 +1,12 @@
+# Antigravity Ultra - Tests: File Operations
+from agent.tools.file_ops import FileOpsTool
+
+
+def test_list_directory_empty_path_lists_cwd(tmp_path, monkeypatch):
+    """An empty path lists the working directory"""
+    (tmp_path / "b.txt").write_text("x")
+    (tmp_path / "a").mkdir()
+    monkeypatch.chdir(tmp_path)
+    
+    items = FileOpsTool(allowed_paths=[str(tmp_path)]).list_directory("")
+    assert [(i.path, i.is_dir, i.extension) for i in items] == [("a", True, ""), ("b.txt", False, ".txt")]
@@ -0,0 +1,61 @@
+# Antigravity Ultra - Tests: Models
+import asyncio
+
+import orjson
+import pytest
+
+import models
+from models import ChatMessage, ModelOrchestrator
+
+
+@pytest.mark.parametrize("yield_every_ms", [16, 0])
+def test_chat_stream_closes_provider_stream(yield_every_ms):
+    """Stopping early closes the provider's stream before aclose returns"""
+    closed = []
+    
+    async def stream(*args, **kwargs):
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield "token"
+        finally:
+            closed.append(True)
+    
+    async def main():
+        orchestrator = ModelOrchestrator()
+        orchestrator._ensure_warm = lambda: None
+        orchestrator._stream_fns = dict.fromkeys(models.MODELS_BY_PROVIDER["groq"], stream)
+        model = models.MODELS_BY_PROVIDER["groq"][0]
+        
+        chunks = orchestrator.chat_stream([ChatMessage("user", "hi")], model, yield_every_ms=yield_every_ms)
+        async for chunk in chunks:
+            break
+        await chunks.aclose()
+        assert closed == [True]
+        await orchestrator.close()
+    
+    asyncio.run(main())
+
+
+def test_cached_chat_encodes_history_once(monkeypatch):
+    """The cache key and the request body share one encoding of the history"""
+    encoded = []
+    encode = models._encode
+    monkeypatch.setattr(models, "_encode", lambda messages: encoded.append(1) or encode(messages))
+    
+    async def main():
+        orchestrator = ModelOrchestrator()
+        orchestrator._ensure_warm = lambda: None
+        model = models.MODELS_BY_PROVIDER["groq"][0]
+        
+        async def chat(messages, model, temperature, max_tokens, serialized):
+            assert orjson.loads(orjson.dumps(serialized)) == [{"role": "user", "content": "hi"}]
+            return models.ModelResponse("hello", model, 1, "stop")
+        
+        orchestrator._chat_fns = dict.fromkeys(models.MODELS_BY_PROVIDER["groq"], chat)
+        response = await orchestrator.chat([ChatMessage("user", "hi")], model, temperature=0.0)
+        assert response.content == "hello"
+        assert len(encoded) == 1
+        await orchestrator.close()
+    
+    asyncio.run(main())